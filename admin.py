@@ -3,6 +3,14 @@ Admin script for managing the AOM server.
 
 Usage:
     python admin.py init                      - Initialize database with sample data
+    python admin.py migrate                   - Apply pending schema migrations (indexes, columns)
+    python admin.py check-indexes             - Verify hot queries are served by indexes
+    python admin.py recompress [batch_size]   - Rewrite GameData saves with the configured codec
+    python admin.py backfill-progress [batch_size] - Fill GameData's indexed golds/stage/wave/prestige columns
+    python admin.py save-history <user_id>    - List the kept versions of a user's cloud saves
+    python admin.py restore-save <game_data_id> <version> - Restore a cloud save version
+        - Versions are only kept with GAME_DATA_HISTORY_ENABLED. Snapshots are restored byte for byte;
+          versions rebuilt from deltas are the same JSON re-serialized (spacing, number format)
     python admin.py add-notice <image_url>    - Add a notice (requires valid image URL)
     python admin.py add-coupon                - Add a sample coupon
     python admin.py list-users                - List all users
@@ -37,11 +45,18 @@ import asyncio
 import sys
 import json
 
-from sqlalchemy import select
-from database import async_session, init_db
+from sqlalchemy import select, bindparam
+from database import async_session, init_db, engine
+from config import settings
+from migrations import explain_hot_queries
+from services.parse_query import find_all
+from services.save_history import save_history, SNAPSHOT
 from models.user import User, Session
 from models.user_summary import UserSummary
-from models.game_data import GameData
+from models.game_data import (
+    GameData, PROGRESS_FIELDS, SAVE_DATA_COLUMNS, encode_save_data, extract_progress, parse_save_object
+)
+from models.game_data_history import GameDataHistory
 from models.notice import Notice
 from models.drop_box import DropBox
 from models.coupon import Coupon
@@ -53,6 +68,199 @@ async def init_database():
     print("Database initialized successfully!")
 
 
+async def migrate_database():
+    """Create missing tables and apply pending schema migrations"""
+    applied = await init_db()
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        print("Database schema is up to date.")
+
+
+async def check_indexes():
+    """Print the query plan of every hot query and flag full scans"""
+    report = await explain_hot_queries(engine)
+    failed = 0
+    for entry in report:
+        status = "OK  " if entry["usesIndex"] else "SCAN"
+        if not entry["usesIndex"]:
+            failed += 1
+        print(f"[{status}] {entry['query']}")
+        for line in entry["plan"]:
+            print(f"         {line}")
+    print(f"\n{len(report) - failed}/{len(report)} hot queries use an index")
+    return failed == 0
+
+
+def _stored_size(row) -> int:
+    if row.dataCodec is not None:
+        return len(row.dataBlob)
+    return len(row.data.encode("utf-8")) if row.data else 0
+
+
+async def recompress_game_data(batch_size: int = 500):
+    """Rewrite GameData saves stored with a codec other than GAME_DATA_COMPRESSION
+
+    Rows without a content hash (written before it existed) get one too.
+    """
+    table = GameData.__table__
+    statement = (
+        table.update()
+        .where(table.c.objectId == bindparam("b_objectId"))
+        .values(
+            **{key: bindparam(f"b_{key}") for key in SAVE_DATA_COLUMNS},
+            # Recompressing is not a client-visible change
+            updatedAt=table.c.updatedAt
+        )
+    )
+    codec = settings.GAME_DATA_COMPRESSION or "none"
+    scanned = rewritten = size_before = size_after = 0
+    last_id = ""
+    while True:
+        async with async_session() as db:
+            result = await db.execute(
+                select(table.c.objectId, table.c.data, table.c.dataBlob, table.c.dataCodec, table.c.dataHash)
+                .where(table.c.objectId > last_id)
+                .order_by(table.c.objectId)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1].objectId
+            scanned += len(rows)
+
+            params = []
+            for row in rows:
+                values = encode_save_data(GameData.save_data(row))
+                if (
+                    values["dataCodec"] == row.dataCodec
+                    and values["data"] == row.data
+                    and values["dataHash"] == row.dataHash
+                ):
+                    continue
+                size_before += _stored_size(row)
+                size_after += len(values["dataBlob"]) if values["dataCodec"] else _stored_size(row)
+                params.append({"b_objectId": row.objectId, **{f"b_{key}": value for key, value in values.items()}})
+
+            if params:
+                connection = await db.connection()
+                await connection.execute(statement, params)
+                await db.commit()
+                rewritten += len(params)
+        print(f"  scanned {scanned}, rewritten {rewritten}")
+
+    print(f"Recompressed {rewritten}/{scanned} GameData rows with codec {codec}")
+    if size_before:
+        print(f"  {size_before} -> {size_after} bytes ({size_after / size_before:.1%})")
+
+
+async def backfill_progress(batch_size: int = 500):
+    """Fill GameData's indexed progress columns from the stored saves"""
+    table = GameData.__table__
+    progress_columns = [table.c[name] for name in PROGRESS_FIELDS]
+    statement = (
+        table.update()
+        .where(table.c.objectId == bindparam("b_objectId"))
+        .values(
+            **{name: bindparam(f"b_{name}") for name in PROGRESS_FIELDS},
+            updatedAt=table.c.updatedAt
+        )
+    )
+    scanned = updated = 0
+    last_id = ""
+    while True:
+        async with async_session() as db:
+            result = await db.execute(
+                select(table.c.objectId, table.c.data, table.c.dataBlob, table.c.dataCodec, *progress_columns)
+                .where(table.c.objectId > last_id)
+                .order_by(table.c.objectId)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1].objectId
+            scanned += len(rows)
+
+            params = []
+            for row in rows:
+                values = extract_progress(parse_save_object(GameData.save_data(row)))
+                if all(getattr(row, name) == value for name, value in values.items()):
+                    continue
+                params.append({"b_objectId": row.objectId, **{f"b_{name}": value for name, value in values.items()}})
+
+            if params:
+                connection = await db.connection()
+                await connection.execute(statement, params)
+                await db.commit()
+                updated += len(params)
+        print(f"  scanned {scanned}, updated {updated}")
+
+    print(f"Backfilled progress columns ({settings.GAME_DATA_INDEXED_FIELDS or 'none'}) on {updated}/{scanned} GameData rows")
+
+
+async def list_save_history(user_id: str):
+    """List the kept history versions of a user's GameData"""
+    async with async_session() as db:
+        result = await db.execute(
+            select(
+                GameDataHistory.gameDataId,
+                GameDataHistory.version,
+                GameDataHistory.kind,
+                GameDataHistory.payload,
+                GameDataHistory.createdAt
+            )
+            .where(GameDataHistory.userId == user_id)
+            .order_by(GameDataHistory.gameDataId, GameDataHistory.version)
+        )
+        rows = result.all()
+
+    if not rows:
+        print(f"No save history for user {user_id}")
+        return
+
+    game_data_id = None
+    for row in rows:
+        if row.gameDataId != game_data_id:
+            game_data_id = row.gameDataId
+            print(f"\n=== GameData {game_data_id} ===")
+        size = len(row.payload) if row.payload is not None else 0
+        print(f"  v{row.version:<5} {row.kind:<8} {size:>7} bytes  {row.createdAt}")
+
+
+async def restore_save(game_data_id: str, version: int):
+    """Write a past version of a GameData save back as its newest version"""
+    async with async_session() as db:
+        result = await db.execute(select(GameData).where(GameData.objectId == game_data_id))
+        game_data = result.scalar_one_or_none()
+        if not game_data:
+            print(f"GameData not found: {game_data_id}")
+            return
+
+        try:
+            text = await save_history.materialize(db, game_data_id, version)
+        except KeyError as e:
+            print(e.args[0])
+            return
+        result = await db.execute(
+            select(GameDataHistory.kind)
+            .where(GameDataHistory.gameDataId == game_data_id, GameDataHistory.version == version)
+        )
+        rebuilt = result.scalar_one() != SNAPSHOT
+
+        current_version = game_data.historyVersion
+        game_data.set_save_data(text)
+        # Restoring is itself a new version, so it can be undone the same way
+        await save_history.append_instance(db, game_data, text)
+        await db.commit()
+
+    print(f"Restored GameData {game_data_id} to version {version} (now version {game_data.historyVersion}, was {current_version})")
+    if rebuilt:
+        print("Version was rebuilt from deltas: same JSON content, re-serialized rather than the client's exact bytes")
+    print(f"\n注意: 存档同时存储在客户端本地，需要用户从云端加载存档才能生效")
+
+
 async def add_sample_notice(image_url: str = None):
     """Add a notice with image URL
 
@@ -108,21 +316,21 @@ async def add_sample_coupon():
 async def list_users():
     """List all users"""
     async with async_session() as db:
-        result = await db.execute(select(User))
-        users = result.scalars().all()
-
-        if not users:
-            print("No users found.")
-            return
-
-        print(f"Found {len(users)} users:")
-        for user in users:
+        count = 0
+        async for user in find_all(db, "_User"):
+            count += 1
             print(f"  - {user.objectId}: {user.username}")
             if user.email:
                 print(f"    Email: {user.email}")
             if user.googleUserId:
                 print(f"    Google ID: {user.googleUserId}")
 
+        if not count:
+            print("No users found.")
+            return
+
+        print(f"Found {count} users.")
+
 
 async def add_sample_dropbox():
     """Add sample dropbox items - DEPRECATED: Use send-mail command instead"""
@@ -204,23 +412,22 @@ async def send_mail_to_all(reward_type: str, amount: str, title: str = None, msg
         msg: Optional message
     """
     async with async_session() as db:
-        # Get all users
-        result = await db.execute(select(User))
-        users = result.scalars().all()
-
-        if not users:
-            print("No users found.")
-            return
-
-        print(f"Sending mail to {len(users)} users...")
+        print("Sending mail to all users...")
 
+        # Walk users page by page instead of loading them all at once
+        user_count = 0
         success_count = 0
-        for user in users:
+        async for user in find_all(db, "_User"):
+            user_count += 1
             result = await send_mail_reward(user.objectId, reward_type, amount, title, msg)
             if result:
                 success_count += 1
 
-        print(f"\nMail sent to {success_count}/{len(users)} users.")
+        if not user_count:
+            print("No users found.")
+            return
+
+        print(f"\nMail sent to {success_count}/{user_count} users.")
 
 
 async def list_user_mail(user_id: str):
@@ -234,8 +441,8 @@ async def list_user_mail(user_id: str):
             return
 
         # Get mail items
-        result = await db.execute(select(DropBox).where(DropBox.userId == user_id))
-        items = result.scalars().all()
+        where = json.dumps({"user": user_id})
+        items = [item async for item in find_all(db, "DropBox", where, "createdAt")]
 
         if not items:
             print(f"No mail items for user {user.username} ({user_id})")
@@ -330,19 +537,21 @@ async def get_user_info(user_id: str):
         else:
             print(f"\n  No UserSummary found for this user")
 
-        # Find game data for gold
-        result = await db.execute(select(GameData).where(GameData.userId == user_id))
-        game_data = result.scalar_one_or_none()
-
-        if game_data and game_data.data:
-            try:
-                save_data = json.loads(game_data.data)
-                print(f"\n=== Currency (服务端 GameData/云存档) ===")
-                print(f"  金币 (Gold): {save_data.get('golds', 0)}")
-                print(f"  关卡 (Stage): {save_data.get('stage', 0)}")
-                print(f"  波次 (Wave): {save_data.get('wave', 0)}")
-            except json.JSONDecodeError:
-                print(f"\n  GameData exists but data is not valid JSON")
+        # Progress comes from the indexed columns; the save blob is not loaded
+        result = await db.execute(
+            select(GameData.golds, GameData.stage, GameData.wave, GameData.prestige)
+            .where(GameData.userId == user_id)
+        )
+        progress = result.first()
+
+        if progress:
+            print(f"\n=== Currency (服务端 GameData/云存档) ===")
+            print(f"  金币 (Gold): {progress.golds}")
+            print(f"  关卡 (Stage): {progress.stage}")
+            print(f"  波次 (Wave): {progress.wave}")
+            print(f"  转生 (Prestige): {progress.prestige}")
+            if all(value is None for value in progress):
+                print(f"  (columns are empty: run 'python admin.py backfill-progress')")
         else:
             print(f"\n  No GameData (云存档) found for this user")
 
@@ -462,18 +671,22 @@ async def set_gold(user_id: str, amount: float):
         if not game_data:
             # Create new GameData with default save data
             save_data = {"golds": amount}
-            game_data = GameData(userId=user_id, data=json.dumps(save_data))
+            game_data = GameData(userId=user_id, **encode_save_data(json.dumps(save_data)))
             db.add(game_data)
+            await db.flush()
             old_value = 0
         else:
             try:
-                save_data = json.loads(game_data.data) if game_data.data else {}
+                text = game_data.save_data()
+                save_data = json.loads(text) if text else {}
             except json.JSONDecodeError:
                 save_data = {}
-            old_value = save_data.get("golds", 0)
+            old_value = game_data.golds if game_data.golds is not None else save_data.get("golds", 0)
             save_data["golds"] = amount
-            game_data.data = json.dumps(save_data)
+            game_data.set_save_data(json.dumps(save_data))
 
+        if save_history.enabled:
+            await save_history.append_instance(db, game_data, game_data.save_data())
         await db.commit()
         print(f"Updated 金币 (Gold) for user {user_id}")
         print(f"  {old_value} -> {amount}")
@@ -497,20 +710,24 @@ async def add_gold(user_id: str, amount: float):
         if not game_data:
             # Create new GameData with default save data
             save_data = {"golds": amount}
-            game_data = GameData(userId=user_id, data=json.dumps(save_data))
+            game_data = GameData(userId=user_id, **encode_save_data(json.dumps(save_data)))
             db.add(game_data)
+            await db.flush()
             old_value = 0
             new_value = amount
         else:
             try:
-                save_data = json.loads(game_data.data) if game_data.data else {}
+                text = game_data.save_data()
+                save_data = json.loads(text) if text else {}
             except json.JSONDecodeError:
                 save_data = {}
-            old_value = save_data.get("golds", 0)
+            old_value = game_data.golds if game_data.golds is not None else save_data.get("golds", 0)
             new_value = old_value + amount
             save_data["golds"] = new_value
-            game_data.data = json.dumps(save_data)
+            game_data.set_save_data(json.dumps(save_data))
 
+        if save_history.enabled:
+            await save_history.append_instance(db, game_data, game_data.save_data())
         await db.commit()
         print(f"Added {amount} 金币 (Gold) to user {user_id}")
         print(f"  {old_value} -> {new_value}")
@@ -534,6 +751,31 @@ async def main():
         print("\nNote: No notices were added. To add a notice, use:")
         print("  python admin.py add-notice <image_url>")
 
+    elif command == "migrate":
+        await migrate_database()
+
+    elif command == "check-indexes":
+        if not await check_indexes():
+            sys.exit(1)
+
+    elif command == "recompress":
+        await recompress_game_data(int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+
+    elif command == "backfill-progress":
+        await backfill_progress(int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+
+    elif command == "save-history":
+        if len(sys.argv) < 3:
+            print("Usage: python admin.py save-history <user_id>")
+            return
+        await list_save_history(sys.argv[2])
+
+    elif command == "restore-save":
+        if len(sys.argv) < 4:
+            print("Usage: python admin.py restore-save <game_data_id> <version>")
+            return
+        await restore_save(sys.argv[2], int(sys.argv[3]))
+
     elif command == "add-notice":
         image_url = sys.argv[2] if len(sys.argv) > 2 else None
         await add_sample_notice(image_url)
@@ -0,0 +1,281 @@
+"""
+Micro-benchmarks for the server's hot paths.
+
+Usage:
+    python bench.py serialize [rows]    - Response serialization cost for BattleLog/DropBox rows
+    python bench.py read-path [rows]    - ORM entities vs Core rows for query results (temp SQLite)
+    python bench.py stream [rows]       - Peak memory of buffered vs streamed find responses
+    python bench.py dates [count]       - format_parse_date cost against the old strftime version
+
+Results are printed per 1,000 rows (best of several runs). Redirect to
+bench_output.txt to keep a local record.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from models.battle_log import BattleLog
+from models.drop_box import DropBox
+from models.friend_relation import FriendRelation
+from models.notice import Notice
+from models.user import format_parse_date
+from config import settings
+from responses import ParseJSONResponse, dumps, orjson
+from services.parse_query import compile_query, row_columns
+
+
+def make_battle_logs(count: int) -> list[BattleLog]:
+    """Transient BattleLog rows with every column populated"""
+    now = datetime.now(timezone.utc)
+    return [
+        BattleLog(
+            objectId=f"b{i:09d}",
+            senderId=f"s{i % 97:09d}",
+            receiverId=f"r{i % 89:09d}",
+            senderScore=i * 7,
+            receiverScore=i * 5,
+            senderWin=bool(i % 2),
+            senderClaim=bool(i % 3),
+            receiverClaim=bool(i % 5),
+            expired=False,
+            receivedAt=now - timedelta(seconds=i),
+            createdAt=now - timedelta(seconds=i, milliseconds=i),
+            updatedAt=now - timedelta(milliseconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def make_drop_boxes(count: int) -> list[DropBox]:
+    """Transient DropBox rows with a localized JSON title"""
+    now = datetime.now(timezone.utc)
+    return [
+        DropBox(
+            objectId=f"d{i:09d}",
+            userId=f"u{i % 97:09d}",
+            type="Gems",
+            title='{"en": "Daily Reward", "zh": "每日奖励"}',
+            value=str(i * 10),
+            msg="Thank you for playing!",
+            createdAt=now - timedelta(seconds=i),
+            updatedAt=now - timedelta(milliseconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def make_friend_relations(count: int) -> list[FriendRelation]:
+    now = datetime.now(timezone.utc)
+    return [
+        FriendRelation(
+            objectId=f"f{i:09d}",
+            user1Id=f"u{i % 97:09d}",
+            user2Id=f"u{i + 100:09d}",
+            createdAt=now - timedelta(seconds=i),
+            updatedAt=now - timedelta(milliseconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def make_notices(count: int) -> list[Notice]:
+    now = datetime.now(timezone.utc)
+    return [
+        Notice(
+            objectId=f"n{i:09d}",
+            imageURL=f"https://example.com/notice/{i}.png",
+            order=i,
+            text='{"en": "Maintenance tonight", "zh": "今晚维护"}',
+            url="https://example.com",
+            createdAt=now - timedelta(seconds=i),
+            updatedAt=now - timedelta(milliseconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def row_values(obj) -> dict:
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+
+def best_ms(func, number: int = 5, repeat: int = 5) -> float:
+    """Best wall time of one call, in milliseconds"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1000
+
+
+def bench_serialize(rows: int = 1000):
+    scale = 1000 / rows
+    print(f"Serialization per 1,000 rows (rows={rows}, orjson={'yes' if orjson else 'no'})")
+    print(f"  {'class':<10} {'to_dict':>10} {'before':>10} {'after':>10} {'speedup':>8}")
+
+    for name, objects in (("BattleLog", make_battle_logs(rows)), ("DropBox", make_drop_boxes(rows))):
+        content = {"results": [obj.to_dict() for obj in objects]}
+        assert json.loads(ParseJSONResponse(content).body) == json.loads(JSONResponse(content).body)
+
+        to_dict = best_ms(lambda: [obj.to_dict() for obj in objects]) * scale
+        # Before: FastAPI's default path, jsonable_encoder then stdlib json
+        before = best_ms(lambda: JSONResponse(jsonable_encoder(content)).body) * scale
+        # After: encoder-ready dicts rendered directly
+        after = best_ms(lambda: ParseJSONResponse(content).body) * scale
+        print(f"  {name:<10} {to_dict:>8.2f}ms {before:>8.2f}ms {after:>8.2f}ms {before / after:>7.1f}x")
+
+
+@asynccontextmanager
+async def temp_database(fixtures):
+    """Engine on a throwaway SQLite file holding the given (model, objects) pairs"""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        async with engine.begin() as conn:
+            for model, objects in fixtures:
+                await conn.run_sync(model.__table__.create)
+                await conn.execute(insert(model), [row_values(obj) for obj in objects])
+        try:
+            yield engine
+        finally:
+            await engine.dispose()
+
+
+async def _measure(session_maker, read, repeat: int = 5) -> tuple[float, int]:
+    """Best CPU time (ms) and tracemalloc peak (bytes) of one read in a fresh session"""
+    best_cpu = None
+    for _ in range(repeat):
+        async with session_maker() as db:
+            started = time.process_time()
+            await read(db)
+            elapsed = (time.process_time() - started) * 1000
+        best_cpu = elapsed if best_cpu is None else min(best_cpu, elapsed)
+
+    async with session_maker() as db:
+        tracemalloc.start()
+        await read(db)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best_cpu, peak
+
+
+async def _bench_read_path(rows: int):
+    fixtures = (
+        (BattleLog, make_battle_logs(rows)),
+        (DropBox, make_drop_boxes(rows)),
+        (FriendRelation, make_friend_relations(rows)),
+        (Notice, make_notices(rows)),
+    )
+    scale = 1000 / rows
+
+    async with temp_database(fixtures) as engine:
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        print(f"Read path per 1,000 rows (rows={rows}): fetch + to_dict, CPU time and peak memory")
+        print(f"  {'class':<15} {'ORM':>9} {'Core':>9} {'speedup':>8} {'ORM mem':>10} {'Core mem':>10}")
+        for model, _ in fixtures:
+            async def orm_read(db):
+                result = await db.execute(select(model))
+                return [obj.to_dict() for obj in result.scalars()]
+
+            async def core_read(db):
+                result = await db.execute(select(*row_columns(model)))
+                return [model.to_dict(row) for row in result]
+
+            async with session_maker() as db:
+                assert await orm_read(db) == await core_read(db)
+
+            orm_cpu, orm_peak = await _measure(session_maker, orm_read)
+            core_cpu, core_peak = await _measure(session_maker, core_read)
+            print(
+                f"  {model.__name__:<15} {orm_cpu * scale:>7.2f}ms {core_cpu * scale:>7.2f}ms "
+                f"{orm_cpu / core_cpu:>7.1f}x {orm_peak * scale / 1024:>8.0f}KB {core_peak * scale / 1024:>8.0f}KB"
+            )
+
+
+def bench_read_path(rows: int = 1000):
+    asyncio.run(_bench_read_path(rows))
+
+
+async def _bench_stream(sizes: list[int]):
+    # Let the benchmark ask for more rows than the production cap
+    settings.QUERY_MAX_LIMIT = max(sizes)
+
+    async def buffered(query, engine) -> int:
+        async with AsyncSession(engine) as db:
+            return len(dumps({"results": query.serialize(await query.fetch(db))}))
+
+    async def streamed(query, engine) -> int:
+        return sum([len(chunk) async for chunk in query.stream(engine)])
+
+    print(f"Peak Python memory of a BattleLog find (chunk={settings.QUERY_STREAM_CHUNK_SIZE} rows)")
+    print(f"  {'rows':>7} {'body':>9} {'buffered':>10} {'streamed':>10}")
+    for rows in sizes:
+        async with temp_database(((BattleLog, make_battle_logs(rows)),)) as engine:
+            query = compile_query("BattleLog", None, "-createdAt", rows, 0)
+            peaks = []
+            for render in (buffered, streamed):
+                tracemalloc.start()
+                size = await render(query, engine)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            print(f"  {rows:>7} {size / 1e6:>7.1f}MB {peaks[0] / 1e6:>8.1f}MB {peaks[1] / 1e6:>8.1f}MB")
+
+
+def bench_stream(rows: int = 50000):
+    asyncio.run(_bench_stream([rows // 25, rows // 5, rows]))
+
+
+def strftime_parse_date(dt: datetime) -> str:
+    """The previous format_parse_date, kept as the baseline"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def bench_dates(count: int = 3000):
+    now = datetime.now(timezone.utc)
+    aware = [now - timedelta(seconds=i // 7, microseconds=i * 997) for i in range(count)]
+    # SQLite hands back naive UTC values, PostgreSQL aware ones
+    naive = [dt.replace(tzinfo=None) for dt in aware]
+
+    # Same output as the strftime version; the parse_date round trip is in tests/test_dates.py
+    for dt in aware + naive:
+        assert format_parse_date(dt) == strftime_parse_date(dt)
+
+    scale = 1000 / count
+    print(f"format_parse_date per 1,000 timestamps (count={count})")
+    print(f"  {'input':<8} {'strftime':>10} {'current':>10} {'speedup':>8}")
+    for name, values in (("aware", aware), ("naive", naive)):
+        before = best_ms(lambda: [strftime_parse_date(dt) for dt in values]) * scale
+        after = best_ms(lambda: [format_parse_date(dt) for dt in values]) * scale
+        print(f"  {name:<8} {before:>8.3f}ms {after:>8.3f}ms {before / after:>7.1f}x")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    command = sys.argv[1]
+    if command == "serialize":
+        bench_serialize(int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    elif command == "read-path":
+        bench_read_path(int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    elif command == "stream":
+        bench_stream(int(sys.argv[2]) if len(sys.argv) > 2 else 50000)
+    elif command == "dates":
+        bench_dates(int(sys.argv[2]) if len(sys.argv) > 2 else 3000)
+    else:
+        print(f"Unknown command: {command}")
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
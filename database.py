@@ -1,5 +1,12 @@
+from collections import OrderedDict
+from typing import Callable, Optional
+import time
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Session as OrmSession
 from config import settings
 
 
@@ -7,18 +14,235 @@ class Base(DeclarativeBase):
     pass
 
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+def engine_options(database_url: str) -> dict:
+    """Backend-specific create_async_engine() keyword arguments"""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        return {}
+
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "server_settings": {
+                "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS),
+                "application_name": "aom-server",
+            }
+        }
+    return options
+
+
+class TrackedSession(OrmSession):
+    """ORM session that remembers whether its transaction wrote anything"""
+
+
+def after_commit(session, callback: Callable[[], None]):
+    """Run callback once the session's transaction commits
+
+    For in-memory side effects of a write (counters, caches) that must not
+    happen if the transaction rolls back or is re-run. Callbacks are
+    dropped on rollback; releasing a savepoint does not run them.
+    """
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+engine = create_async_engine(settings.DATABASE_URL, echo=False, **engine_options(settings.DATABASE_URL))
+async_session = async_sessionmaker(
+    engine, class_=AsyncSession, sync_session_class=TrackedSession, expire_on_commit=False
+)
+
+# Optional read replica used by read-only query handlers
+read_engine = None
+async_read_session = None
+if settings.READ_DATABASE_URL:
+    read_engine = create_async_engine(
+        settings.READ_DATABASE_URL, echo=False, **engine_options(settings.READ_DATABASE_URL)
+    )
+    async_read_session = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def dialect_insert(model):
+    """INSERT for the active backend, exposing on_conflict_do_nothing/do_update
+
+    Both SQLite (3.35+) and PostgreSQL support ON CONFLICT and RETURNING, so
+    handlers can insert-or-skip in one statement instead of select-then-insert.
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def sqlite_pragmas() -> dict:
+    """Pragmas applied to every new SQLite connection, in order"""
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+        # The models rely on ondelete="CASCADE", which SQLite ignores unless enabled
+        "foreign_keys": "ON" if settings.SQLITE_FOREIGN_KEYS else "OFF",
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _begin_before_savepoint(conn, name):
+    # pysqlite only emits BEGIN before DML, so a SAVEPOINT opening the
+    # transaction would start it itself and its RELEASE would commit it
+    if not conn.connection.driver_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN")
+
+
+for _engine in (engine, read_engine):
+    if _engine is not None and _engine.dialect.name == "sqlite":
+        event.listen(_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        event.listen(_engine.sync_engine, "savepoint", _begin_before_savepoint)
+
+
+async def get_active_pragmas() -> dict:
+    """Read back the pragmas in effect on a pooled connection (SQLite only)"""
+    if engine.dialect.name != "sqlite":
+        return {}
+    async with engine.connect() as conn:
+        return {
+            name: (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+            for name in sqlite_pragmas()
+        }
+
+
+class ReadRouter:
+    """Decides per request whether reads may go to the replica
 
+    A caller (identified by session token) that committed a write within the
+    last READ_REPLICA_MAX_LAG_SECONDS keeps reading from the primary, so it
+    always sees its own writes even if the replica lags behind.
+    """
 
-async def get_db():
+    def __init__(self, max_lag_seconds: float):
+        self.max_lag_seconds = max_lag_seconds
+        # Oldest write first, so expired callers are popped from the front
+        self._last_write: "OrderedDict[str, float]" = OrderedDict()
+        self.primary_reads = 0
+        self.replica_reads = 0
+
+    def record_write(self, session_token: str):
+        now = time.monotonic()
+        self._last_write[session_token] = now
+        self._last_write.move_to_end(session_token)
+        self._expire(now)
+
+    def record_read(self, replica: bool):
+        if replica:
+            self.replica_reads += 1
+        else:
+            self.primary_reads += 1
+
+    def use_replica(self, session_token: Optional[str]) -> bool:
+        if async_read_session is None:
+            return False
+        self._expire(time.monotonic())
+        return not (session_token and session_token in self._last_write)
+
+    def _expire(self, now: float):
+        """Forget callers whose writes are old enough to have replicated"""
+        cutoff = now - self.max_lag_seconds
+        while self._last_write:
+            session_token, last_write = next(iter(self._last_write.items()))
+            if last_write >= cutoff:
+                break
+            del self._last_write[session_token]
+
+    def stats(self) -> dict:
+        total = self.primary_reads + self.replica_reads
+        return {
+            "replicaConfigured": async_read_session is not None,
+            "maxLagSeconds": self.max_lag_seconds,
+            "recentWriters": len(self._last_write),
+            "primaryReads": self.primary_reads,
+            "replicaReads": self.replica_reads,
+            "replicaRatio": round(self.replica_reads / total, 4) if total else 0.0,
+        }
+
+
+read_router = ReadRouter(settings.READ_REPLICA_MAX_LAG_SECONDS)
+
+
+@event.listens_for(TrackedSession, "after_flush")
+def _mark_flush_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(TrackedSession, "do_orm_execute")
+def _mark_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(TrackedSession, "after_commit")
+def _record_committed_write(session):
+    if session.in_nested_transaction():
+        # A released savepoint; its outer transaction may still roll back
+        return
+    if session.info.pop("wrote", False):
+        session_token = session.info.get("session_token")
+        if session_token:
+            read_router.record_write(session_token)
+    for callback in session.info.pop("after_commit", ()):
+        callback()
+
+
+@event.listens_for(TrackedSession, "after_rollback")
+def _discard_write(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop("wrote", None)
+    session.info.pop("after_commit", None)
+
+
+async def get_db(request: Request):
     async with async_session() as session:
+        session.info["session_token"] = request.headers.get("X-Parse-Session-Token")
         try:
             yield session
         finally:
             await session.close()
 
 
-async def init_db():
+async def get_read_db(request: Request):
+    """Session for read-only handlers: the replica when configured and safe
+
+    A read is only counted if the session was used: the create_or_query_*
+    handlers get one on every call but only query when `where` is set.
+    Handlers that read through the session's bind instead (streamed query
+    results) set session.info["read"].
+    """
+    replica = read_router.use_replica(request.headers.get("X-Parse-Session-Token"))
+    async with (async_read_session if replica else async_session)() as session:
+        try:
+            yield session
+        finally:
+            if session.in_transaction() or session.info.get("read"):
+                read_router.record_read(replica)
+
+
+async def init_db() -> list[int]:
+    """Create missing tables, then apply pending migrations (returns their versions)"""
+    from migrations import run_migrations
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    return await run_migrations(engine)
@@ -4,12 +4,20 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from typing import Optional
 from datetime import datetime
+import asyncio
 import uvicorn
 import json
 import logging
 
 from config import settings
-from database import init_db
+from database import init_db, async_session, engine, get_active_pragmas, read_router
+from services.session_cache import session_cache
+from services.revocation import revocation_list
+from services.session_sweeper import run_session_sweeper
+from services.write_queue import write_queue
+from services.game_data_buffer import game_data_buffer, save_stats
+from services.save_history import save_history, run_history_compactor
+from services.parse_query import statement_cache_stats
 from routers import (
     users_router,
     login_router,
@@ -32,12 +40,33 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Startup
     await init_db()
+    async with async_session() as db:
+        await revocation_list.load(db)
+    background_tasks = []
+    if settings.SESSION_SWEEP_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            run_session_sweeper(settings.SESSION_SWEEP_INTERVAL_SECONDS)
+        ))
+    if settings.GAME_DATA_HISTORY_ENABLED and settings.GAME_DATA_HISTORY_COMPACT_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            run_history_compactor(settings.GAME_DATA_HISTORY_COMPACT_INTERVAL_SECONDS)
+        ))
+    if settings.WRITE_QUEUE_ENABLED:
+        write_queue.start()
+    if settings.GAME_DATA_WRITE_BEHIND:
+        game_data_buffer.start()
     print(f"Server started on http://{settings.HOST}:{settings.PORT}")
     print(f"Parse endpoint: http://{settings.HOST}:{settings.PORT}/parse/")
     print(f"Application ID: {settings.APPLICATION_ID}")
     yield
     # Shutdown
     print("Server shutting down...")
+    # Drain buffered and queued writes before the background tasks and engine go away
+    await game_data_buffer.stop()
+    await write_queue.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
 
 
 app = FastAPI(
@@ -158,7 +187,21 @@ async def parse_root():
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "database": {
+            "dialect": engine.dialect.name,
+            "pragmas": await get_active_pragmas(),
+            "readRouting": read_router.stats(),
+        },
+        "sessionCache": session_cache.stats(),
+        "revokedSessions": revocation_list.stats(),
+        "writeQueue": write_queue.stats(),
+        "gameDataBuffer": game_data_buffer.stats(),
+        "gameDataSaves": save_stats.stats(),
+        "saveHistory": save_history.stats(),
+        "queryCache": statement_cache_stats(),
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+"""
+Versioned schema migrations.
+
+create_all() only creates missing tables, so indexes and columns added to the
+models later never reach existing databases. Each migration here runs once,
+in version order, and is recorded in the schema_migrations table. Index
+migrations use CREATE INDEX IF NOT EXISTS (CONCURRENTLY on PostgreSQL), so
+they are no-ops on fresh databases and do not block writers on PostgreSQL.
+Column migrations likewise skip columns that create_all() already made.
+"""
+
+from datetime import datetime, timezone
+import logging
+
+from sqlalchemy import Column, Integer, String, DateTime, Table, select, update, delete, func, and_, or_, desc, false, inspect
+from sqlalchemy.schema import CreateIndex
+
+from database import Base
+from models.user import Session
+from models.friend_relation import FriendRelation
+from models.battle_log import BattleLog
+from models.drop_box import DropBox
+from models.game_data import GameData
+
+
+logger = logging.getLogger(__name__)
+
+
+schema_migrations = Table(
+    "schema_migrations",
+    Base.metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("appliedAt", DateTime(timezone=True), nullable=False),
+)
+
+
+def _find_index(name: str):
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(f"Unknown index: {name}")
+
+
+def create_indexes(*names: str):
+    """Migration step that builds model-declared indexes on existing tables"""
+    async def step(engine):
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for name in names:
+                ddl = str(CreateIndex(_find_index(name), if_not_exists=True).compile(dialect=conn.dialect))
+                if conn.dialect.name == "postgresql":
+                    ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+                await conn.exec_driver_sql(ddl)
+    return step
+
+
+def add_columns(table_name: str, *names: str):
+    """Migration step that adds model-declared (nullable) columns to an existing table"""
+    async def step(engine):
+        table = Base.metadata.tables[table_name]
+        async with engine.begin() as conn:
+            existing = await conn.run_sync(
+                lambda sync_conn: {column["name"] for column in inspect(sync_conn).get_columns(table_name)}
+            )
+            preparer = conn.dialect.identifier_preparer
+            for name in names:
+                if name in existing:
+                    continue
+                column = table.c[name]
+                await conn.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=conn.dialect)}"
+                )
+    return step
+
+
+async def unique_friend_pairs(engine):
+    """Store every friend pair in friend_pair() order and drop the duplicates,
+    so the unique pair index can replace the old non-unique one"""
+    table = FriendRelation.__table__
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(table)
+            .where(table.c.user1Id > table.c.user2Id)
+            .values(user1Id=table.c.user2Id, user2Id=table.c.user1Id, updatedAt=table.c.updatedAt)
+        )
+        keep = select(func.min(table.c.objectId)).group_by(table.c.user1Id, table.c.user2Id)
+        result = await conn.execute(delete(table).where(table.c.objectId.not_in(keep)))
+        if result.rowcount:
+            logger.info(f"Removed {result.rowcount} duplicate friend relations")
+        await conn.exec_driver_sql("DROP INDEX IF EXISTS ix_friend_relations_user1_user2")
+    await create_indexes("ix_friend_relations_pair")(engine)
+
+
+# (version, name, step) - append only, never renumber
+MIGRATIONS = [
+    (1, "session expiry and owner indexes", create_indexes(
+        "ix_sessions_expiresAt",
+        "ix_sessions_userId",
+        "ix_session_revocations_expiresAt",
+    )),
+    # ix_friend_relations_user1_user2 was built here until migration 9 replaced it
+    (2, "hot query composite indexes", create_indexes(
+        "ix_friend_relations_user2_user1",
+        "ix_battle_logs_sender_receiver_created",
+        "ix_drop_boxes_user_created",
+        "ix_game_data_user_updated",
+    )),
+    (3, "partial indexes for open battle logs", create_indexes(
+        "ix_battle_logs_receiver_open",
+        "ix_battle_logs_sender_open",
+    )),
+    (4, "compressed game data columns", add_columns("game_data", "dataBlob", "dataCodec")),
+    (5, "game data content hash", add_columns("game_data", "dataHash")),
+    # The game_data_history table itself is created by create_all()
+    (6, "game data history version", add_columns("game_data", "historyVersion")),
+    # Existing rows stay NULL until `admin.py backfill-progress`
+    (7, "game data progress columns", add_columns("game_data", "golds", "stage", "wave", "prestige")),
+    (8, "game data progress indexes", create_indexes(
+        "ix_game_data_golds",
+        "ix_game_data_stage",
+        "ix_game_data_wave",
+        "ix_game_data_prestige",
+    )),
+    (9, "unique friend pairs", unique_friend_pairs),
+    (10, "friend list sort indexes", create_indexes(
+        "ix_friend_relations_createdAt",
+        "ix_user_summaries_createdAt",
+    )),
+]
+
+
+async def run_migrations(engine) -> list[int]:
+    """Apply pending migrations in order and return the versions applied"""
+    async with engine.begin() as conn:
+        await conn.run_sync(schema_migrations.create, checkfirst=True)
+        result = await conn.execute(select(schema_migrations.c.version))
+        applied_versions = set(result.scalars())
+
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version in applied_versions:
+            continue
+        logger.info(f"Applying migration {version}: {name}")
+        await step(engine)
+        async with engine.begin() as conn:
+            await conn.execute(schema_migrations.insert().values(
+                version=version,
+                name=name,
+                appliedAt=datetime.now(timezone.utc)
+            ))
+        applied.append(version)
+    return applied
+
+
+def hot_queries() -> dict:
+    """The statements the index pack exists for, keyed by a short name"""
+    user_id, friend_id = "user000001", "user000002"
+    return {
+        "session by token": select(Session).where(Session.sessionToken == "r:token"),
+        "expired sessions": select(Session.id).where(Session.expiresAt < datetime.now(timezone.utc)).limit(500),
+        "friend relations of user": select(FriendRelation).where(
+            or_(FriendRelation.user1Id == user_id, FriendRelation.user2Id == user_id)
+        ),
+        "friend relation pair": select(FriendRelation).where(
+            and_(FriendRelation.user1Id == user_id, FriendRelation.user2Id == friend_id)
+        ),
+        "latest battle log per friend": select(BattleLog)
+            .where(and_(BattleLog.senderId == user_id, BattleLog.receiverId == friend_id))
+            .order_by(desc(BattleLog.createdAt))
+            .limit(1),
+        "open battle logs for receiver": select(BattleLog)
+            .where(and_(
+                BattleLog.receiverId == user_id,
+                BattleLog.receiverClaim == false(),
+                BattleLog.expired == false(),
+            ))
+            .order_by(desc(BattleLog.createdAt)),
+        "drop box of user": select(DropBox).where(DropBox.userId == user_id).order_by(desc(DropBox.createdAt)),
+        "game data of user": select(GameData).where(GameData.userId == user_id).order_by(desc(GameData.updatedAt)),
+        "players above stage": select(GameData.userId, GameData.stage).where(GameData.stage > 500),
+    }
+
+
+def _plan_uses_index(dialect_name: str, plan_lines: list[str]) -> bool:
+    if dialect_name == "sqlite":
+        # Every table access must be an index SEARCH, never a full SCAN
+        accesses = [line for line in plan_lines if line.startswith(("SCAN", "SEARCH", "MULTI-INDEX"))]
+        return bool(accesses) and not any(
+            line.startswith("SCAN") and "INDEX" not in line for line in accesses
+        )
+    # PostgreSQL may still prefer a Seq Scan on tiny tables; run ANALYZE on real data first
+    return any("Index" in line for line in plan_lines) and not any("Seq Scan" in line for line in plan_lines)
+
+
+async def explain_hot_queries(engine) -> list[dict]:
+    """EXPLAIN each hot query and report whether its plan is index-driven"""
+    report = []
+    async with engine.connect() as conn:
+        dialect = conn.dialect
+        explain = "EXPLAIN QUERY PLAN " if dialect.name == "sqlite" else "EXPLAIN "
+        for name, statement in hot_queries().items():
+            compiled = statement.compile(dialect=dialect)
+            params = tuple(compiled.params[key] for key in compiled.positiontup)
+            result = await conn.exec_driver_sql(explain + str(compiled), params)
+            # SQLite returns (id, parent, notused, detail); PostgreSQL one text column
+            plan_lines = [str(row[-1]).strip() for row in result]
+            report.append({
+                "query": name,
+                "usesIndex": _plan_uses_index(dialect.name, plan_lines),
+                "plan": plan_lines,
+            })
+    return report
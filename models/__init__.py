@@ -1,7 +1,8 @@
 # Models package
-from models.user import User, Session
+from models.user import User, Session, SessionRevocation
 from models.user_summary import UserSummary
 from models.game_data import GameData
+from models.game_data_history import GameDataHistory
 from models.friend_relation import FriendRelation
 from models.battle_log import BattleLog
 from models.notice import Notice
@@ -11,8 +12,10 @@ from models.coupon import Coupon
 __all__ = [
     "User",
     "Session",
+    "SessionRevocation",
     "UserSummary",
     "GameData",
+    "GameDataHistory",
     "FriendRelation",
     "BattleLog",
     "Notice",
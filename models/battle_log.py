@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Index, and_, column, false
 from datetime import datetime, timezone
 import uuid
 
@@ -12,8 +12,28 @@ def generate_object_id():
     return uuid.uuid4().hex[:10]
 
 
+# Open (unclaimed, unexpired) logs per side; queries must compare the flags
+# against literal false for the planner to pick up the partial indexes
+_receiver_open = and_(column("receiverClaim") == false(), column("expired") == false())
+_sender_open = and_(column("senderClaim") == false(), column("expired") == false())
+
+
 class BattleLog(Base):
     __tablename__ = "battle_logs"
+    __table_args__ = (
+        # Latest log per (sender, receiver) for findLatestBattleLogPerFriend
+        Index("ix_battle_logs_sender_receiver_created", "senderId", "receiverId", "createdAt"),
+        Index(
+            "ix_battle_logs_receiver_open", "receiverId", "createdAt",
+            sqlite_where=_receiver_open,
+            postgresql_where=_receiver_open,
+        ),
+        Index(
+            "ix_battle_logs_sender_open", "senderId", "createdAt",
+            sqlite_where=_sender_open,
+            postgresql_where=_sender_open,
+        ),
+    )
 
     objectId = Column(String(10), primary_key=True, default=generate_object_id)
     senderId = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False, index=True)
@@ -24,9 +44,9 @@ class BattleLog(Base):
     senderClaim = Column(Boolean, default=False)
     receiverClaim = Column(Boolean, default=False)
     expired = Column(Boolean, default=False)
-    receivedAt = Column(DateTime, nullable=True)
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updatedAt = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    receivedAt = Column(DateTime(timezone=True), nullable=True)
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updatedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     def to_dict(self):
         result = {
@@ -47,3 +67,4 @@ class BattleLog(Base):
         else:
             result["receivedAt"] = {"__type": "Date", "iso": "0001-01-01T00:00:00.000Z"}
         return result
+
@@ -24,8 +24,8 @@ class Coupon(Base):
     currentRedemptions = Column(Integer, default=0)
     isActive = Column(Boolean, default=True)
     redeemedBy = Column(String(1000), default="")  # Comma-separated list of player names
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updatedAt = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updatedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     def to_dict(self):
         return {
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 import uuid
@@ -27,6 +27,9 @@ class DropBox(Base):
     - "AdFree": Ad-free privilege
     """
     __tablename__ = "drop_boxes"
+    __table_args__ = (
+        Index("ix_drop_boxes_user_created", "userId", "createdAt"),
+    )
 
     objectId = Column(String(10), primary_key=True, default=generate_object_id)
     userId = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False, index=True)
@@ -34,8 +37,8 @@ class DropBox(Base):
     title = Column(Text, nullable=True)  # JSON string: {"en": "...", "zh": "..."}
     value = Column(String(255), nullable=True)
     msg = Column(String(500), nullable=True)
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updatedAt = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updatedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     # Relationship
     user = relationship("User", backref="drop_boxes")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Table
+from sqlalchemy import Column, String, DateTime, ForeignKey, Table, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 import uuid
@@ -13,6 +13,11 @@ def generate_object_id():
     return uuid.uuid4().hex[:10]
 
 
+def friend_pair(user_a: str, user_b: str) -> tuple[str, str]:
+    """(user1Id, user2Id) of a relation: the smaller objectId first"""
+    return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+
 # Association table for many-to-many relationship
 friend_relation_users = Table(
     'friend_relation_users',
@@ -24,12 +29,21 @@ friend_relation_users = Table(
 
 class FriendRelation(Base):
     __tablename__ = "friend_relations"
+    __table_args__ = (
+        # Pairs are stored in friend_pair() order, so one unique index keeps a
+        # pair from being added twice; with the reverse index "users contains X"
+        # (user1Id = X OR user2Id = X) is an index search whichever side X is on
+        Index("ix_friend_relations_pair", "user1Id", "user2Id", unique=True),
+        Index("ix_friend_relations_user2_user1", "user2Id", "user1Id"),
+        # The friend list query sorts by order=createdAt
+        Index("ix_friend_relations_createdAt", "createdAt"),
+    )
 
     objectId = Column(String(10), primary_key=True, default=generate_object_id)
     user1Id = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False)
     user2Id = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False)
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updatedAt = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updatedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     def to_dict(self):
         return {
@@ -1,29 +1,164 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, Text, LargeBinary, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
+from typing import Optional
+import hashlib
+import json
+import math
 import uuid
+import zlib
 
 import sys
 sys.path.append('..')
 from database import Base
 from models.user import format_parse_date
+from config import settings
 
 
 def generate_object_id():
     return uuid.uuid4().hex[:10]
 
 
+# codec name -> (compress, decompress); rows without a codec keep plain text in `data`
+SAVE_DATA_CODECS = {
+    "zlib": (
+        lambda raw: zlib.compress(raw, settings.GAME_DATA_COMPRESSION_LEVEL),
+        zlib.decompress,
+    ),
+}
+
+
+# SaveData fields that can be copied into their own indexed column: name -> type
+PROGRESS_FIELDS = {
+    "golds": float,
+    "stage": int,
+    "wave": int,
+    "prestige": int,
+}
+
+
+def _indexed_progress_fields() -> tuple:
+    names = tuple(name.strip() for name in settings.GAME_DATA_INDEXED_FIELDS.split(",") if name.strip())
+    unknown = [name for name in names if name not in PROGRESS_FIELDS]
+    if unknown:
+        raise ValueError(f"Unsupported GAME_DATA_INDEXED_FIELDS: {', '.join(unknown)}")
+    return names
+
+
+INDEXED_PROGRESS_FIELDS = _indexed_progress_fields()
+
+
+def parse_save_object(text: Optional[str]) -> Optional[dict]:
+    """The save as a dict, or None when it is not a JSON object"""
+    if text is None:
+        return None
+    try:
+        state = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return state if isinstance(state, dict) else None
+
+
+# Integer columns are 32-bit on PostgreSQL (64-bit on SQLite); keep to the narrower range
+_INT_MIN, _INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def _progress_value(kind: type, value) -> Optional[float]:
+    """value converted to its column type, or None if it is not a number that fits"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    try:
+        # int() fails on inf/nan, float() on integers beyond the double range
+        value = kind(value)
+    except (OverflowError, ValueError):
+        return None
+    if kind is int:
+        return value if _INT_MIN <= value <= _INT_MAX else None
+    return value if math.isfinite(value) else None
+
+
+def extract_progress(state: Optional[dict]) -> dict:
+    """Column values of the indexed progress fields
+
+    A field is None when absent or when it is not a number the column can
+    hold; the save itself is stored either way.
+    """
+    values = dict.fromkeys(PROGRESS_FIELDS)
+    if state is None:
+        return values
+    for name in INDEXED_PROGRESS_FIELDS:
+        values[name] = _progress_value(PROGRESS_FIELDS[name], state.get(name))
+    return values
+
+
+def save_data_hash(text: Optional[str]) -> Optional[str]:
+    """Content hash of a save blob, independent of how it is stored"""
+    if text is None:
+        return None
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def encode_save_data(text: Optional[str], state: Optional[dict] = None) -> dict:
+    """Column values storing a save blob with the configured codec
+
+    Saves shorter than GAME_DATA_COMPRESSION_MIN_BYTES (or any save when
+    GAME_DATA_COMPRESSION is empty) are stored as plain text. `state` is
+    the save already parsed by parse_save_object, if the caller has it.
+    """
+    if state is None:
+        state = parse_save_object(text)
+    values = {"data": text, "dataBlob": None, "dataCodec": None, "dataHash": save_data_hash(text)}
+    values.update(extract_progress(state))
+
+    codec = settings.GAME_DATA_COMPRESSION
+    if codec and text is not None and len(text) >= settings.GAME_DATA_COMPRESSION_MIN_BYTES:
+        compress, _ = SAVE_DATA_CODECS[codec]
+        values.update(data=None, dataBlob=compress(text.encode("utf-8")), dataCodec=codec)
+    return values
+
+
+# Every column encode_save_data() sets
+SAVE_DATA_COLUMNS = ("data", "dataBlob", "dataCodec", "dataHash") + tuple(PROGRESS_FIELDS)
+
+
 class GameData(Base):
     __tablename__ = "game_data"
+    __table_args__ = (
+        Index("ix_game_data_user_updated", "userId", "updatedAt"),
+        Index("ix_game_data_golds", "golds"),
+        Index("ix_game_data_stage", "stage"),
+        Index("ix_game_data_wave", "wave"),
+        Index("ix_game_data_prestige", "prestige"),
+    )
 
     objectId = Column(String(10), primary_key=True, default=generate_object_id)
     userId = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False, index=True)
-    data = Column(Text, nullable=True)  # JSON string of SaveData
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updatedAt = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    data = Column(Text, nullable=True)  # JSON string of SaveData (uncompressed rows)
+    dataBlob = Column(LargeBinary, nullable=True)  # SaveData compressed with dataCodec
+    dataCodec = Column(String(16), nullable=True)  # None: plain text in data
+    dataHash = Column(String(32), nullable=True)  # save_data_hash() of the save, None until first written
+    historyVersion = Column(Integer, nullable=True)  # latest GameDataHistory version, None before history
+    # Copies of SaveData fields (see PROGRESS_FIELDS), NULL unless listed in GAME_DATA_INDEXED_FIELDS
+    golds = Column(Float, nullable=True)
+    stage = Column(Integer, nullable=True)
+    wave = Column(Integer, nullable=True)
+    prestige = Column(Integer, nullable=True)
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updatedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     user = relationship("User", back_populates="game_data")
 
+    def save_data(self) -> Optional[str]:
+        """The SaveData JSON string, decompressed if needed"""
+        if self.dataCodec is None:
+            return self.data
+        _, decompress = SAVE_DATA_CODECS[self.dataCodec]
+        return decompress(self.dataBlob).decode("utf-8")
+
+    def set_save_data(self, text: Optional[str]):
+        for key, value in encode_save_data(text).items():
+            setattr(self, key, value)
+
     def to_dict(self):
         return {
             "objectId": self.objectId,
@@ -32,7 +167,7 @@ class GameData(Base):
                 "className": "_User",
                 "objectId": self.userId
             },
-            "data": self.data,
+            "data": GameData.save_data(self),
             "createdAt": format_parse_date(self.createdAt),
             "updatedAt": format_parse_date(self.updatedAt),
         }
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, String, Integer, LargeBinary, DateTime, ForeignKey, Index
+from datetime import datetime, timezone
+import uuid
+
+import sys
+sys.path.append('..')
+from database import Base
+
+
+def generate_object_id():
+    return uuid.uuid4().hex[:10]
+
+
+class GameDataHistory(Base):
+    """One version of a GameData save, for rolling back corrupted cloud saves
+
+    A "snapshot" holds the full save text; a "delta" holds the top-level key
+    changes against the previous version (see services.save_history). Both
+    are zlib-compressed; payload is NULL for a save of null.
+    """
+    __tablename__ = "game_data_history"
+    __table_args__ = (
+        Index("ix_game_data_history_object_version", "gameDataId", "version", unique=True),
+    )
+
+    objectId = Column(String(10), primary_key=True, default=generate_object_id)
+    gameDataId = Column(String(10), ForeignKey("game_data.objectId", ondelete="CASCADE"), nullable=False)
+    userId = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    kind = Column(String(8), nullable=False)  # "snapshot" or "delta"
+    payload = Column(LargeBinary, nullable=True)
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
@@ -21,8 +21,8 @@ class Notice(Base):
     order = Column(Integer, default=0)
     text = Column(Text, nullable=True)  # JSON string: {"en": "...", "zh": "..."}
     url = Column(String(500), nullable=True)
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updatedAt = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updatedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     def to_dict(self):
         text_dict = {}
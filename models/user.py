@@ -2,7 +2,6 @@ from sqlalchemy import Column, String, DateTime, ForeignKey, Boolean
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 import uuid
-import hashlib
 
 import sys
 sys.path.append('..')
@@ -17,11 +16,13 @@ def format_parse_date(dt: datetime) -> str:
     """Format datetime to Parse SDK expected format: yyyy-MM-ddTHH:mm:ss.fffZ"""
     if dt is None:
         return None
-    # Ensure we have UTC time
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    # Format with milliseconds
-    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+    # Naive values are already UTC; aware ones are converted when not UTC
+    tzinfo = dt.tzinfo
+    if tzinfo is not None and tzinfo is not timezone.utc and dt.utcoffset():
+        dt = dt.astimezone(timezone.utc)
+    # isoformat() is implemented in C and several times faster than strftime;
+    # [:23] drops the "+00:00" suffix of aware values
+    return dt.isoformat(timespec="milliseconds")[:23] + "Z"
 
 
 class User(Base):
@@ -32,8 +33,8 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     email = Column(String(255), nullable=True, index=True)
     googleUserId = Column(String(255), nullable=True, unique=True, index=True)
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updatedAt = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updatedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     # Relationships
     sessions = relationship("Session", back_populates="user", cascade="all, delete-orphan")
@@ -41,12 +42,18 @@ class User(Base):
     game_data = relationship("GameData", back_populates="user", cascade="all, delete-orphan")
 
     def set_password(self, password: str):
-        """Hash and set the password"""
-        self.password_hash = hashlib.sha256(password.encode()).hexdigest()
+        """Hash and set the password
+
+        Blocks while hashing; request handlers should use
+        AuthService.hash_password, which runs off the event loop.
+        """
+        from services.passwords import hash_password_sync
+        self.password_hash = hash_password_sync(password)
 
     def verify_password(self, password: str) -> bool:
-        """Verify the password against the stored hash"""
-        return self.password_hash == hashlib.sha256(password.encode()).hexdigest()
+        """Verify the password against the stored hash (blocking, see set_password)"""
+        from services.passwords import verify_password_sync
+        return verify_password_sync(password, self.password_hash)[0]
 
     def to_dict(self, include_session_token=False):
         result = {
@@ -85,8 +92,24 @@ class Session(Base):
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     sessionToken = Column(String(255), unique=True, nullable=False, index=True)
-    userId = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False)
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    expiresAt = Column(DateTime, nullable=True)
+    userId = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False, index=True)
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    expiresAt = Column(DateTime(timezone=True), nullable=True, index=True)
 
     user = relationship("User", back_populates="sessions")
+
+
+class SessionRevocation(Base):
+    """Revoked signed session tokens
+
+    A row either revokes one token (jti set) or every token issued to a user
+    before revokedAt (userId set, jti null). Rows are only needed until the
+    tokens they cover would have expired anyway.
+    """
+    __tablename__ = "session_revocations"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    jti = Column(String(32), nullable=True, index=True)
+    userId = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=True, index=True)
+    revokedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    expiresAt = Column(DateTime(timezone=True), nullable=False, index=True)
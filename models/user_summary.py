@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 import uuid
@@ -15,6 +15,10 @@ def generate_object_id():
 
 class UserSummary(Base):
     __tablename__ = "user_summaries"
+    __table_args__ = (
+        # The friend list sorts its summaries by order=createdAt
+        Index("ix_user_summaries_createdAt", "createdAt"),
+    )
 
     objectId = Column(String(10), primary_key=True, default=generate_object_id)
     userId = Column(String(10), ForeignKey("users.objectId", ondelete="CASCADE"), nullable=False, unique=True)
@@ -24,8 +28,8 @@ class UserSummary(Base):
     ruby = Column(Integer, default=0)
     gem = Column(Integer, default=0)
     moecrystal = Column(Integer, default=0)
-    createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updatedAt = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    createdAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updatedAt = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     user = relationship("User", back_populates="user_summary")
 
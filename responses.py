@@ -0,0 +1,32 @@
+"""
+Fast JSON responses for the Parse routers.
+
+FastAPI runs every returned dict through jsonable_encoder before rendering
+it, which walks each nested value in Python. The models' to_dict() methods
+already return plain str/int/bool/list/dict values, so hot handlers can
+return a ParseJSONResponse directly and skip the encoder entirely.
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize encoder-ready content to UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class ParseJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when installed (stdlib json otherwise)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,65 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, desc, asc
-from typing import Optional, Any
+from sqlalchemy import select, update, delete, or_, func
+from sqlalchemy.exc import IntegrityError
+from typing import Optional
 from datetime import datetime, timezone
-import json
 
-from database import get_db
+from database import get_db, get_read_db, dialect_insert, after_commit
 from models.user import User, format_parse_date
 from models.user_summary import UserSummary
-from models.game_data import GameData
-from models.friend_relation import FriendRelation
+from models.game_data import GameData, encode_save_data, parse_save_object
+from models.friend_relation import FriendRelation, friend_pair
 from models.battle_log import BattleLog
 from models.notice import Notice
 from models.drop_box import DropBox
 from services.auth import AuthService
+from services.auth_context import AuthContext, get_auth_context
+from services.write_queue import run_write
+from services.game_data_buffer import game_data_buffer, save_stats
+from services.save_history import save_history
+from services.parse_query import FindOptions, get_find_options, compile_query, parse_pointer, parse_date
+from responses import ParseJSONResponse
 
 
-router = APIRouter(prefix="/parse/classes", tags=["classes"])
+router = APIRouter(prefix="/parse/classes", tags=["classes"], default_response_class=ParseJSONResponse)
 
 
-async def get_current_user(
-    x_parse_session_token: Optional[str] = Header(None, alias="X-Parse-Session-Token"),
-    db: AsyncSession = Depends(get_db)
-) -> Optional[User]:
-    if not x_parse_session_token:
-        return None
-    return await AuthService.get_user_by_session_token(db, x_parse_session_token)
-
+async def _run_query(
+    class_name: str,
+    where: Optional[str],
+    order: Optional[str],
+    limit: int,
+    skip: int,
+    db: AsyncSession,
+    options: FindOptions
+):
+    """Run a Parse find through the shared query compiler"""
+    query = compile_query(class_name, where, order, limit, skip, options.cursor, options.keys, options.include)
+    if query.streamed:
+        db.info["read"] = True
+        return StreamingResponse(query.stream(db.bind, options.count), media_type="application/json")
+
+    objects = await query.fetch(db)
+
+    results = query.serialize(objects)
+    if query.include:
+        await query.resolve_includes(db, objects, results)
+
+    response = {"results": results}
+    if options.count:
+        response["count"] = await query.count(db)
+    if query.cursor_mode:
+        response["nextCursor"] = query.next_cursor(objects)
+    # to_dict() output is already JSON-ready, so skip jsonable_encoder
+    return ParseJSONResponse(response)
+
+
+def _pick_fields(data: dict, fields: tuple) -> dict:
+    """The subset of a request body that names the given columns"""
+    return {field: data[field] for field in fields if field in data}
+
+
+async def _update_fields(db: AsyncSession, model, object_id: str, values: dict) -> dict:
+    """Blind partial update: one UPDATE ... RETURNING updatedAt, 404 if no row matched
+
+    Only the columns in `values` are sent, so the row (e.g. a GameData save
+    blob) is never loaded just to be overwritten. With nothing to update
+    the row is left alone (updatedAt included) and only looked up.
+    """
+    if values:
+        statement = (
+            update(model)
+            .where(model.objectId == object_id)
+            .values(**values)
+            .returning(model.updatedAt)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        statement = select(model.updatedAt).where(model.objectId == object_id)
+    result = await db.execute(statement)
+    row = result.first()
 
-def parse_where_clause(where_json: str) -> dict:
-    """Parse the where clause from JSON string"""
-    if not where_json:
-        return {}
-    try:
-        return json.loads(where_json)
-    except:
-        return {}
+    if row is None:
+        raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
 
+    return {"updatedAt": format_parse_date(row.updatedAt)}
 
-def parse_pointer(pointer: Any) -> Optional[str]:
-    """Extract objectId from a Parse Pointer or return None for null values"""
-    if pointer is None:
-        return None
-    if isinstance(pointer, dict) and pointer.get("__type") == "Pointer":
-        return pointer.get("objectId")
-    if isinstance(pointer, str):
-        return pointer
-    return None
 
+@asynccontextmanager
+async def checked_insert(session: AsyncSession):
+    """Savepoint around a create; a pointer to a missing object is a Parse error
 
-def parse_date(date_obj: Any) -> Optional[datetime]:
-    """Parse a Parse Date object"""
-    if isinstance(date_obj, dict) and date_obj.get("__type") == "Date":
-        iso_str = date_obj.get("iso", "")
-        if iso_str:
+    With foreign keys enforced the INSERT of such an object fails. Only the
+    savepoint is rolled back, so the session stays usable for the rest of
+    its transaction (other batch items, other queued writes). A session
+    with no transaction yet has nothing to protect, so it skips the
+    SAVEPOINT/RELEASE round trips and is rolled back instead.
+    """
+    try:
+        if session.in_transaction():
+            async with session.begin_nested():
+                yield
+        else:
             try:
-                iso_str = iso_str.replace("Z", "+00:00")
-                return datetime.fromisoformat(iso_str)
-            except:
-                pass
-    return None
+                yield
+                await session.flush()
+            except IntegrityError:
+                await session.rollback()
+                raise
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail={"code": 111, "error": "Pointer to a missing object"})
+
+
+def _delete_object(model, object_id: str):
+    """Write operation deleting one object by objectId (404 if missing)
+
+    A single DELETE: the object is never loaded just to be removed.
+    """
+    async def operation(db: AsyncSession):
+        result = await db.execute(
+            delete(model)
+            .where(model.objectId == object_id)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
+        return {}
+    return operation
 
 
 # ==================== _User (Parse internal user class) ====================
@@ -70,31 +138,11 @@ async def query_users(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query User objects (Parse uses _User as class name)"""
-    query = select(User)
-
-    where_dict = parse_where_clause(where)
-
-    if "objectId" in where_dict:
-        query = query.where(User.objectId == where_dict["objectId"])
-
-    if "username" in where_dict:
-        query = query.where(User.username == where_dict["username"])
-
-    if order:
-        if order.startswith("-"):
-            query = query.order_by(desc(getattr(User, order[1:], User.createdAt)))
-        else:
-            query = query.order_by(asc(getattr(User, order, User.createdAt)))
-
-    query = query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    users = result.scalars().all()
-
-    return {"results": [u.to_parse_response() for u in users]}
+    return await _run_query("_User", where, order, limit, skip, db, options)
 
 
 @router.post("/_User")
@@ -111,25 +159,20 @@ async def create_user(
     if not username or not password:
         raise HTTPException(status_code=400, detail={"code": 200, "error": "Username and password required"})
 
-    # Check if username exists
-    result = await db.execute(select(User).where(User.username == username))
-    if result.scalar_one_or_none():
+    # Create user (fails atomically if the username is taken)
+    user = await AuthService.insert_user_if_absent(
+        db,
+        username=username,
+        password_hash=await AuthService.hash_password(password),
+        email=data.get("email"),
+        google_user_id=data.get("googleUserId")
+    )
+    if not user:
         raise HTTPException(status_code=400, detail={"code": 202, "error": "Username already taken"})
 
-    # Create user
-    user = User(username=username, email=data.get("email"))
-    user.set_password(password)
-
-    # Set additional fields
-    if "googleUserId" in data:
-        user.googleUserId = data["googleUserId"]
-
-    db.add(user)
+    # Create session in the same transaction
+    session_token = await AuthService.issue_session(db, user.objectId, new_user=True)
     await db.commit()
-    await db.refresh(user)
-
-    # Create session
-    session_token = await AuthService.create_session_for_user(db, user)
 
     return {
         "objectId": user.objectId,
@@ -141,7 +184,7 @@ async def create_user(
 @router.get("/_User/{object_id}")
 async def get_user(
     object_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get User by objectId"""
     result = await db.execute(select(User).where(User.objectId == object_id))
@@ -157,7 +200,7 @@ async def get_user(
 async def update_user(
     object_id: str,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Update User object"""
@@ -174,7 +217,7 @@ async def update_user(
     if "email" in data:
         user.email = data["email"]
     if "password" in data:
-        user.set_password(data["password"])
+        user.password_hash = await AuthService.hash_password(data["password"])
     if "googleUserId" in data:
         # Handle delete operation: {"__op": "Delete"}
         if isinstance(data["googleUserId"], dict) and data["googleUserId"].get("__op") == "Delete":
@@ -183,7 +226,7 @@ async def update_user(
             user.googleUserId = data["googleUserId"]
 
     await db.commit()
-    await db.refresh(user)
+    AuthService.invalidate_cached_user(user.objectId)
 
     return {"updatedAt": format_parse_date(user.updatedAt)}
 
@@ -192,7 +235,7 @@ async def update_user(
 async def update_user_post(
     object_id: str,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Update User object (POST with _method override)"""
@@ -212,7 +255,7 @@ async def update_user_post(
         if "email" in data:
             user.email = data["email"]
         if "password" in data:
-            user.set_password(data["password"])
+            user.password_hash = await AuthService.hash_password(data["password"])
         if "googleUserId" in data:
             # Handle delete operation: {"__op": "Delete"}
             if isinstance(data["googleUserId"], dict) and data["googleUserId"].get("__op") == "Delete":
@@ -221,7 +264,7 @@ async def update_user_post(
                 user.googleUserId = data["googleUserId"]
 
         await db.commit()
-        await db.refresh(user)
+        AuthService.invalidate_cached_user(user.objectId)
 
         return {"updatedAt": format_parse_date(user.updatedAt)}
 
@@ -230,41 +273,22 @@ async def update_user_post(
 
 # ==================== UserSummary ====================
 
+# Only non-currency fields may be updated from the client. Currency fields
+# (ruby, gem, moecrystal) are protected and can only be modified via admin,
+# so client attempts to set them are ignored.
+USER_SUMMARY_CLIENT_FIELDS = ("displayName", "friendPoint", "friendLimit")
+
+
 async def _query_user_summary(
     where: Optional[str],
     order: Optional[str],
     limit: int,
     skip: int,
-    db: AsyncSession
+    db: AsyncSession,
+    options: FindOptions
 ):
     """Internal function to query UserSummary"""
-    query = select(UserSummary)
-
-    where_dict = parse_where_clause(where)
-
-    # Handle user pointer filter - support both Pointer and null
-    if "user" in where_dict:
-        user_value = where_dict["user"]
-        if user_value is None:
-            # Query for records where userId is NULL
-            query = query.where(UserSummary.userId == None)
-        else:
-            user_id = parse_pointer(user_value)
-            if user_id:
-                query = query.where(UserSummary.userId == user_id)
-
-    if order:
-        if order.startswith("-"):
-            query = query.order_by(desc(getattr(UserSummary, order[1:], UserSummary.createdAt)))
-        else:
-            query = query.order_by(asc(getattr(UserSummary, order, UserSummary.createdAt)))
-
-    query = query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    summaries = result.scalars().all()
-
-    return {"results": [s.to_dict() for s in summaries]}
+    return await _run_query("UserSummary", where, order, limit, skip, db, options)
 
 
 @router.get("/UserSummary")
@@ -273,11 +297,12 @@ async def query_user_summary(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query UserSummary objects (GET)"""
-    return await _query_user_summary(where, order, limit, skip, db)
+    return await _query_user_summary(where, order, limit, skip, db, options)
 
 
 @router.post("/UserSummary")
@@ -287,13 +312,15 @@ async def create_or_query_user_summary(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """Create UserSummary object or query (POST with where param)"""
     # If where parameter exists, this is a query request
     if where is not None:
-        return await _query_user_summary(where, order, limit, skip, db)
+        return await _query_user_summary(where, order, limit, skip, read_db, options)
 
     # Otherwise, create new object
     data = await request.json()
@@ -302,32 +329,34 @@ async def create_or_query_user_summary(
     if not user_id:
         raise HTTPException(status_code=400, detail={"code": 105, "error": "Invalid user pointer"})
 
-    # Check if UserSummary already exists for this user
-    result = await db.execute(select(UserSummary).where(UserSummary.userId == user_id))
-    existing_summary = result.scalar_one_or_none()
+    # Create new UserSummary only if it doesn't exist (ON CONFLICT on the unique userId)
+    async with checked_insert(db):
+        result = await db.execute(
+            dialect_insert(UserSummary)
+            .values(
+                userId=user_id,
+                displayName=data.get("displayName", ""),
+                friendPoint=data.get("friendPoint", 0),
+                friendLimit=data.get("friendLimit", 5),
+                # Currency fields: use client values only for new users
+                ruby=data.get("ruby", 0),
+                gem=data.get("gem", 0),
+                moecrystal=data.get("moecrystal", 0)
+            )
+            .on_conflict_do_nothing(index_elements=["userId"])
+            .returning(UserSummary.objectId, UserSummary.createdAt)
+        )
+        summary = result.first()
 
-    if existing_summary:
+    if summary is None:
         # Return existing summary instead of creating new one
         # This prevents client from overwriting server-side currency values
-        return {
-            "objectId": existing_summary.objectId,
-            "createdAt": format_parse_date(existing_summary.createdAt)
-        }
+        result = await db.execute(
+            select(UserSummary.objectId, UserSummary.createdAt).where(UserSummary.userId == user_id)
+        )
+        summary = result.one()
 
-    # Create new UserSummary only if it doesn't exist
-    summary = UserSummary(
-        userId=user_id,
-        displayName=data.get("displayName", ""),
-        friendPoint=data.get("friendPoint", 0),
-        friendLimit=data.get("friendLimit", 5),
-        # Currency fields: use client values only for new users
-        ruby=data.get("ruby", 0),
-        gem=data.get("gem", 0),
-        moecrystal=data.get("moecrystal", 0)
-    )
-    db.add(summary)
     await db.commit()
-    await db.refresh(summary)
 
     return {
         "objectId": summary.objectId,
@@ -339,46 +368,22 @@ async def create_or_query_user_summary(
 async def update_user_summary(
     object_id: str,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Update UserSummary object"""
-    result = await db.execute(select(UserSummary).where(UserSummary.objectId == object_id))
-    summary = result.scalar_one_or_none()
-
-    if not summary:
-        raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
     data = await request.json()
-
-    # Only allow updating non-currency fields from client
-    # Currency fields (ruby, gem, moecrystal) are protected and can only be modified via admin
-    if "displayName" in data:
-        summary.displayName = data["displayName"]
-    if "friendPoint" in data:
-        summary.friendPoint = data["friendPoint"]
-    if "friendLimit" in data:
-        summary.friendLimit = data["friendLimit"]
-
-    # Currency fields are protected - ignore client attempts to modify them
-    # if "ruby" in data:
-    #     summary.ruby = data["ruby"]
-    # if "gem" in data:
-    #     summary.gem = data["gem"]
-    # if "moecrystal" in data:
-    #     summary.moecrystal = data["moecrystal"]
-
+    response = await _update_fields(db, UserSummary, object_id, _pick_fields(data, USER_SUMMARY_CLIENT_FIELDS))
     await db.commit()
-    await db.refresh(summary)
 
-    return {"updatedAt": format_parse_date(summary.updatedAt)}
+    return response
 
 
 @router.post("/UserSummary/{object_id}")
 async def update_user_summary_post(
     object_id: str,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Update UserSummary object (POST with _method override)"""
@@ -387,72 +392,77 @@ async def update_user_summary_post(
     # Handle _method override from Parse SDK
     method = data.get("_method", "POST")
     if method == "PUT":
-        result = await db.execute(select(UserSummary).where(UserSummary.objectId == object_id))
-        summary = result.scalar_one_or_none()
-
-        if not summary:
-            raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
-        # Only allow updating non-currency fields from client
-        # Currency fields (ruby, gem, moecrystal) are protected and can only be modified via admin
-        if "displayName" in data:
-            summary.displayName = data["displayName"]
-        if "friendPoint" in data:
-            summary.friendPoint = data["friendPoint"]
-        if "friendLimit" in data:
-            summary.friendLimit = data["friendLimit"]
-
-        # Currency fields are protected - ignore client attempts to modify them
-        # if "ruby" in data:
-        #     summary.ruby = data["ruby"]
-        # if "gem" in data:
-        #     summary.gem = data["gem"]
-        # if "moecrystal" in data:
-        #     summary.moecrystal = data["moecrystal"]
-
+        response = await _update_fields(db, UserSummary, object_id, _pick_fields(data, USER_SUMMARY_CLIENT_FIELDS))
         await db.commit()
-        await db.refresh(summary)
 
-        return {"updatedAt": format_parse_date(summary.updatedAt)}
+        return response
 
     raise HTTPException(status_code=405, detail={"code": 1, "error": "Method not allowed"})
 
 
 # ==================== GameData ====================
 
+def _update_game_data(object_id: str, data: dict):
+    """Write operation applying a GameData update
+
+    A save whose content hash matches the stored one is not written; the
+    stored updatedAt is returned instead. Written saves append one history
+    row (see services.save_history).
+    """
+    async def operation(db: AsyncSession):
+        if "data" not in data:
+            return await _update_fields(db, GameData, object_id, {})
+
+        state = parse_save_object(data["data"])
+        values = encode_save_data(data["data"], state)
+        criteria = [GameData.objectId == object_id]
+        if values["dataHash"] is not None:
+            criteria.append(or_(GameData.dataHash == None, GameData.dataHash != values["dataHash"]))
+        if save_history.enabled:
+            values["historyVersion"] = func.coalesce(GameData.historyVersion, 0) + 1
+
+        result = await db.execute(
+            update(GameData)
+            .where(*criteria)
+            .values(**values)
+            .returning(GameData.updatedAt, GameData.userId, GameData.historyVersion)
+            .execution_options(synchronize_session=False)
+        )
+        updated = result.first()
+
+        if updated is None:
+            # Either the object is missing or the save is unchanged
+            result = await db.execute(select(GameData.updatedAt).where(GameData.objectId == object_id))
+            stored = result.first()
+            if stored is None:
+                raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
+            after_commit(db, lambda: save_stats.record(changed=False))
+            return {"updatedAt": format_parse_date(stored.updatedAt)}
+
+        if save_history.enabled:
+            await save_history.append(db, object_id, updated.userId, updated.historyVersion, data["data"], state)
+        after_commit(db, lambda: save_stats.record(changed=True))
+        return {"updatedAt": format_parse_date(updated.updatedAt)}
+    return operation
+
+
+async def _save_game_data(db: AsyncSession, object_id: str, data: dict) -> dict:
+    """Apply a GameData update, through the write-behind buffer when enabled"""
+    if game_data_buffer.running and "data" in data:
+        return await game_data_buffer.save(db, object_id, data["data"])
+    return await run_write(db, _update_game_data(object_id, data))
+
+
 async def _query_game_data(
     where: Optional[str],
     order: Optional[str],
     limit: int,
     skip: int,
-    db: AsyncSession
+    db: AsyncSession,
+    options: FindOptions
 ):
     """Internal function to query GameData"""
-    query = select(GameData)
-
-    where_dict = parse_where_clause(where)
-
-    if "user" in where_dict:
-        user_value = where_dict["user"]
-        if user_value is None:
-            query = query.where(GameData.userId == None)
-        else:
-            user_id = parse_pointer(user_value)
-            if user_id:
-                query = query.where(GameData.userId == user_id)
-
-    if order:
-        if order.startswith("-"):
-            query = query.order_by(desc(getattr(GameData, order[1:], GameData.updatedAt)))
-        else:
-            query = query.order_by(asc(getattr(GameData, order, GameData.updatedAt)))
-
-    query = query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    game_data_list = result.scalars().all()
-
-    return {"results": [gd.to_dict() for gd in game_data_list]}
+    return await _run_query("GameData", where, order, limit, skip, db, options)
 
 
 @router.get("/GameData")
@@ -461,11 +471,12 @@ async def query_game_data(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query GameData objects"""
-    return await _query_game_data(where, order, limit, skip, db)
+    return await _query_game_data(where, order, limit, skip, db, options)
 
 
 @router.post("/GameData")
@@ -475,12 +486,14 @@ async def create_or_query_game_data(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """Create GameData object or query"""
     if where is not None:
-        return await _query_game_data(where, order, limit, skip, db)
+        return await _query_game_data(where, order, limit, skip, read_db, options)
 
     data = await request.json()
 
@@ -488,50 +501,44 @@ async def create_or_query_game_data(
     if not user_id:
         raise HTTPException(status_code=400, detail={"code": 105, "error": "Invalid user pointer"})
 
-    game_data = GameData(
-        userId=user_id,
-        data=data.get("data", "")
-    )
-    db.add(game_data)
-    await db.commit()
-    await db.refresh(game_data)
+    async def create(session: AsyncSession):
+        text = data.get("data", "")
+        state = parse_save_object(text)
+        game_data = GameData(
+            userId=user_id,
+            historyVersion=1 if save_history.enabled else None,
+            **encode_save_data(text, state)
+        )
+        async with checked_insert(session):
+            session.add(game_data)
+        if save_history.enabled:
+            await save_history.append(session, game_data.objectId, user_id, 1, text, state)
 
-    return {
-        "objectId": game_data.objectId,
-        "createdAt": format_parse_date(game_data.createdAt)
-    }
+        return {
+            "objectId": game_data.objectId,
+            "createdAt": format_parse_date(game_data.createdAt)
+        }
+
+    return await run_write(db, create)
 
 
 @router.put("/GameData/{object_id}")
 async def update_game_data(
     object_id: str,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Update GameData object"""
-    result = await db.execute(select(GameData).where(GameData.objectId == object_id))
-    game_data = result.scalar_one_or_none()
-
-    if not game_data:
-        raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
     data = await request.json()
-
-    if "data" in data:
-        game_data.data = data["data"]
-
-    await db.commit()
-    await db.refresh(game_data)
-
-    return {"updatedAt": format_parse_date(game_data.updatedAt)}
+    return await _save_game_data(db, object_id, data)
 
 
 @router.post("/GameData/{object_id}")
 async def update_game_data_post(
     object_id: str,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Update GameData object (POST with _method override)"""
@@ -540,19 +547,7 @@ async def update_game_data_post(
     # Handle _method override from Parse SDK
     method = data.get("_method", "POST")
     if method == "PUT":
-        result = await db.execute(select(GameData).where(GameData.objectId == object_id))
-        game_data = result.scalar_one_or_none()
-
-        if not game_data:
-            raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
-        if "data" in data:
-            game_data.data = data["data"]
-
-        await db.commit()
-        await db.refresh(game_data)
-
-        return {"updatedAt": format_parse_date(game_data.updatedAt)}
+        return await _save_game_data(db, object_id, data)
 
     raise HTTPException(status_code=405, detail={"code": 1, "error": "Method not allowed"})
 
@@ -564,35 +559,11 @@ async def _query_friend_relation(
     order: Optional[str],
     limit: int,
     skip: int,
-    db: AsyncSession
+    db: AsyncSession,
+    options: FindOptions
 ):
     """Internal function to query FriendRelation"""
-    query = select(FriendRelation)
-
-    where_dict = parse_where_clause(where)
-
-    if "users" in where_dict:
-        user_id = parse_pointer(where_dict["users"])
-        if user_id:
-            query = query.where(
-                or_(
-                    FriendRelation.user1Id == user_id,
-                    FriendRelation.user2Id == user_id
-                )
-            )
-
-    if order:
-        if order.startswith("-"):
-            query = query.order_by(desc(getattr(FriendRelation, order[1:], FriendRelation.createdAt)))
-        else:
-            query = query.order_by(asc(getattr(FriendRelation, order, FriendRelation.createdAt)))
-
-    query = query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    relations = result.scalars().all()
-
-    return {"results": [r.to_dict() for r in relations]}
+    return await _run_query("FriendRelation", where, order, limit, skip, db, options)
 
 
 @router.get("/FriendRelation")
@@ -601,11 +572,12 @@ async def query_friend_relation(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query FriendRelation objects"""
-    return await _query_friend_relation(where, order, limit, skip, db)
+    return await _query_friend_relation(where, order, limit, skip, db, options)
 
 
 @router.post("/FriendRelation")
@@ -615,12 +587,14 @@ async def create_or_query_friend_relation(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """Create FriendRelation object or query"""
     if where is not None:
-        return await _query_friend_relation(where, order, limit, skip, db)
+        return await _query_friend_relation(where, order, limit, skip, read_db, options)
 
     data = await request.json()
 
@@ -634,13 +608,27 @@ async def create_or_query_friend_relation(
     if not user1_id or not user2_id:
         raise HTTPException(status_code=400, detail={"code": 105, "error": "Invalid user pointers"})
 
-    relation = FriendRelation(
-        user1Id=user1_id,
-        user2Id=user2_id
-    )
-    db.add(relation)
+    # A pair that already exists returns the existing relation (unique pair index)
+    user1_id, user2_id = friend_pair(user1_id, user2_id)
+    async with checked_insert(db):
+        result = await db.execute(
+            dialect_insert(FriendRelation)
+            .values(user1Id=user1_id, user2Id=user2_id)
+            .on_conflict_do_nothing(index_elements=["user1Id", "user2Id"])
+            .returning(FriendRelation.objectId, FriendRelation.createdAt)
+        )
+        relation = result.first()
+
+    if relation is None:
+        result = await db.execute(
+            select(FriendRelation.objectId, FriendRelation.createdAt).where(
+                FriendRelation.user1Id == user1_id,
+                FriendRelation.user2Id == user2_id
+            )
+        )
+        relation = result.one()
+
     await db.commit()
-    await db.refresh(relation)
 
     return {
         "objectId": relation.objectId,
@@ -651,90 +639,53 @@ async def create_or_query_friend_relation(
 @router.delete("/FriendRelation/{object_id}")
 async def delete_friend_relation(
     object_id: str,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Delete FriendRelation object"""
-    result = await db.execute(select(FriendRelation).where(FriendRelation.objectId == object_id))
-    relation = result.scalar_one_or_none()
+    return await run_write(db, _delete_object(FriendRelation, object_id))
 
-    if not relation:
-        raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
 
-    await db.delete(relation)
-    await db.commit()
+# ==================== BattleLog ====================
 
-    return {}
+def build_battle_log(sender_id: str, receiver_id: str, data: dict) -> BattleLog:
+    """New BattleLog from a create request body (shared with /parse/batch)"""
+    return BattleLog(
+        senderId=sender_id,
+        receiverId=receiver_id,
+        senderScore=data.get("senderScore", 0),
+        receiverScore=data.get("receiverScore", 0),
+        senderWin=data.get("senderWin", False),
+        senderClaim=data.get("senderClaim", False),
+        receiverClaim=data.get("receiverClaim", False),
+        expired=data.get("expired", False),
+        receivedAt=parse_date(data.get("receivedAt"))
+    )
 
 
-# ==================== BattleLog ====================
+def _update_battle_log(object_id: str, data: dict):
+    """Write operation applying a BattleLog update"""
+    values = _pick_fields(
+        data, ("senderScore", "receiverScore", "senderWin", "senderClaim", "receiverClaim", "expired")
+    )
+    if "receivedAt" in data:
+        values["receivedAt"] = parse_date(data["receivedAt"]) or datetime.now(timezone.utc)
+
+    async def operation(db: AsyncSession):
+        return await _update_fields(db, BattleLog, object_id, values)
+    return operation
+
 
 async def _query_battle_log(
     where: Optional[str],
     order: Optional[str],
     limit: int,
     skip: int,
-    db: AsyncSession
+    db: AsyncSession,
+    options: FindOptions
 ):
     """Internal function to query BattleLog"""
-    query = select(BattleLog)
-
-    where_dict = parse_where_clause(where)
-
-    conditions = []
-
-    if "sender" in where_dict:
-        sender_value = where_dict["sender"]
-        if sender_value is None:
-            conditions.append(BattleLog.senderId == None)
-        else:
-            sender_id = parse_pointer(sender_value)
-            if sender_id:
-                conditions.append(BattleLog.senderId == sender_id)
-
-    if "receiver" in where_dict:
-        receiver_value = where_dict["receiver"]
-        if receiver_value is None:
-            conditions.append(BattleLog.receiverId == None)
-        else:
-            receiver_id = parse_pointer(receiver_value)
-            if receiver_id:
-                conditions.append(BattleLog.receiverId == receiver_id)
-
-    if "receiverClaim" in where_dict:
-        conditions.append(BattleLog.receiverClaim == where_dict["receiverClaim"])
-
-    if "senderClaim" in where_dict:
-        conditions.append(BattleLog.senderClaim == where_dict["senderClaim"])
-
-    if "expired" in where_dict:
-        conditions.append(BattleLog.expired == where_dict["expired"])
-
-    if "objectId" in where_dict:
-        conditions.append(BattleLog.objectId == where_dict["objectId"])
-
-    if conditions:
-        query = query.where(and_(*conditions))
-
-    if order:
-        if order.startswith("-"):
-            field_name = order[1:]
-            if field_name == "createdAt":
-                query = query.order_by(desc(BattleLog.createdAt))
-            else:
-                query = query.order_by(desc(getattr(BattleLog, field_name, BattleLog.createdAt)))
-        else:
-            if order == "createdAt":
-                query = query.order_by(asc(BattleLog.createdAt))
-            else:
-                query = query.order_by(asc(getattr(BattleLog, order, BattleLog.createdAt)))
-
-    query = query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    logs = result.scalars().all()
-
-    return {"results": [log.to_dict() for log in logs]}
+    return await _run_query("BattleLog", where, order, limit, skip, db, options)
 
 
 @router.get("/BattleLog")
@@ -743,11 +694,12 @@ async def query_battle_log(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query BattleLog objects"""
-    return await _query_battle_log(where, order, limit, skip, db)
+    return await _query_battle_log(where, order, limit, skip, db, options)
 
 
 @router.post("/BattleLog")
@@ -757,12 +709,14 @@ async def create_or_query_battle_log(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """Create BattleLog object or query"""
     if where is not None:
-        return await _query_battle_log(where, order, limit, skip, db)
+        return await _query_battle_log(where, order, limit, skip, read_db, options)
 
     data = await request.json()
 
@@ -772,71 +726,36 @@ async def create_or_query_battle_log(
     if not sender_id or not receiver_id:
         raise HTTPException(status_code=400, detail={"code": 105, "error": "Invalid sender or receiver pointer"})
 
-    received_at = parse_date(data.get("receivedAt"))
+    async def create(session: AsyncSession):
+        battle_log = build_battle_log(sender_id, receiver_id, data)
+        async with checked_insert(session):
+            session.add(battle_log)
 
-    battle_log = BattleLog(
-        senderId=sender_id,
-        receiverId=receiver_id,
-        senderScore=data.get("senderScore", 0),
-        receiverScore=data.get("receiverScore", 0),
-        senderWin=data.get("senderWin", False),
-        senderClaim=data.get("senderClaim", False),
-        receiverClaim=data.get("receiverClaim", False),
-        expired=data.get("expired", False),
-        receivedAt=received_at
-    )
-    db.add(battle_log)
-    await db.commit()
-    await db.refresh(battle_log)
+        return {
+            "objectId": battle_log.objectId,
+            "createdAt": format_parse_date(battle_log.createdAt)
+        }
 
-    return {
-        "objectId": battle_log.objectId,
-        "createdAt": format_parse_date(battle_log.createdAt)
-    }
+    return await run_write(db, create)
 
 
 @router.put("/BattleLog/{object_id}")
 async def update_battle_log(
     object_id: str,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Update BattleLog object"""
-    result = await db.execute(select(BattleLog).where(BattleLog.objectId == object_id))
-    battle_log = result.scalar_one_or_none()
-
-    if not battle_log:
-        raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
     data = await request.json()
-
-    if "senderScore" in data:
-        battle_log.senderScore = data["senderScore"]
-    if "receiverScore" in data:
-        battle_log.receiverScore = data["receiverScore"]
-    if "senderWin" in data:
-        battle_log.senderWin = data["senderWin"]
-    if "senderClaim" in data:
-        battle_log.senderClaim = data["senderClaim"]
-    if "receiverClaim" in data:
-        battle_log.receiverClaim = data["receiverClaim"]
-    if "expired" in data:
-        battle_log.expired = data["expired"]
-    if "receivedAt" in data:
-        battle_log.receivedAt = parse_date(data["receivedAt"]) or datetime.now(timezone.utc)
-
-    await db.commit()
-    await db.refresh(battle_log)
-
-    return {"updatedAt": format_parse_date(battle_log.updatedAt)}
+    return await run_write(db, _update_battle_log(object_id, data))
 
 
 @router.post("/BattleLog/{object_id}")
 async def update_battle_log_post(
     object_id: str,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Update BattleLog object (POST with _method override)"""
@@ -845,31 +764,7 @@ async def update_battle_log_post(
     # Handle _method override from Parse SDK
     method = data.get("_method", "POST")
     if method == "PUT":
-        result = await db.execute(select(BattleLog).where(BattleLog.objectId == object_id))
-        battle_log = result.scalar_one_or_none()
-
-        if not battle_log:
-            raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
-        if "senderScore" in data:
-            battle_log.senderScore = data["senderScore"]
-        if "receiverScore" in data:
-            battle_log.receiverScore = data["receiverScore"]
-        if "senderWin" in data:
-            battle_log.senderWin = data["senderWin"]
-        if "senderClaim" in data:
-            battle_log.senderClaim = data["senderClaim"]
-        if "receiverClaim" in data:
-            battle_log.receiverClaim = data["receiverClaim"]
-        if "expired" in data:
-            battle_log.expired = data["expired"]
-        if "receivedAt" in data:
-            battle_log.receivedAt = parse_date(data["receivedAt"]) or datetime.now(timezone.utc)
-
-        await db.commit()
-        await db.refresh(battle_log)
-
-        return {"updatedAt": format_parse_date(battle_log.updatedAt)}
+        return await run_write(db, _update_battle_log(object_id, data))
 
     raise HTTPException(status_code=405, detail={"code": 1, "error": "Method not allowed"})
 
@@ -877,20 +772,11 @@ async def update_battle_log_post(
 @router.delete("/BattleLog/{object_id}")
 async def delete_battle_log(
     object_id: str,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Delete BattleLog object"""
-    result = await db.execute(select(BattleLog).where(BattleLog.objectId == object_id))
-    battle_log = result.scalar_one_or_none()
-
-    if not battle_log:
-        raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
-    await db.delete(battle_log)
-    await db.commit()
-
-    return {}
+    return await run_write(db, _delete_object(BattleLog, object_id))
 
 
 # ==================== Notice ====================
@@ -900,28 +786,11 @@ async def _query_notice(
     order: Optional[str],
     limit: int,
     skip: int,
-    db: AsyncSession
+    db: AsyncSession,
+    options: FindOptions
 ):
     """Internal function to query Notice"""
-    query = select(Notice)
-
-    # Filter out notices with empty imageURL (they cause client to hang)
-    query = query.where(Notice.imageURL != None).where(Notice.imageURL != "")
-
-    if order:
-        if order.startswith("-"):
-            query = query.order_by(desc(getattr(Notice, order[1:], Notice.order)))
-        else:
-            query = query.order_by(asc(getattr(Notice, order, Notice.order)))
-    else:
-        query = query.order_by(asc(Notice.order))
-
-    query = query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    notices = result.scalars().all()
-
-    return {"results": [n.to_dict() for n in notices]}
+    return await _run_query("Notice", where, order, limit, skip, db, options)
 
 
 @router.get("/Notice")
@@ -930,10 +799,11 @@ async def query_notice(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query Notice objects (GET)"""
-    return await _query_notice(where, order, limit, skip, db)
+    return await _query_notice(where, order, limit, skip, db, options)
 
 
 @router.post("/Notice")
@@ -943,10 +813,11 @@ async def query_notice_post(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query Notice objects (POST) - Parse SDK sometimes uses POST for queries"""
-    return await _query_notice(where, order, limit, skip, db)
+    return await _query_notice(where, order, limit, skip, db, options)
 
 
 # ==================== DropBox ====================
@@ -956,35 +827,11 @@ async def _query_drop_box(
     order: Optional[str],
     limit: int,
     skip: int,
-    db: AsyncSession
+    db: AsyncSession,
+    options: FindOptions
 ):
     """Internal function to query DropBox"""
-    query = select(DropBox)
-
-    # Parse where clause to filter by user
-    if where:
-        try:
-            where_dict = json.loads(where)
-            # Handle user pointer filter: {"user":{"__type":"Pointer","className":"_User","objectId":"xxx"}}
-            if "user" in where_dict:
-                user_pointer = where_dict["user"]
-                if isinstance(user_pointer, dict) and "objectId" in user_pointer:
-                    query = query.where(DropBox.userId == user_pointer["objectId"])
-        except json.JSONDecodeError:
-            pass
-
-    if order:
-        if order.startswith("-"):
-            query = query.order_by(desc(getattr(DropBox, order[1:], DropBox.createdAt)))
-        else:
-            query = query.order_by(asc(getattr(DropBox, order, DropBox.createdAt)))
-
-    query = query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    items = result.scalars().all()
-
-    return {"results": [item.to_dict() for item in items]}
+    return await _run_query("DropBox", where, order, limit, skip, db, options)
 
 
 @router.get("/DropBox")
@@ -993,10 +840,11 @@ async def query_drop_box(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query DropBox objects"""
-    return await _query_drop_box(where, order, limit, skip, db)
+    return await _query_drop_box(where, order, limit, skip, db, options)
 
 
 @router.post("/DropBox")
@@ -1006,10 +854,11 @@ async def query_drop_box_post(
     order: Optional[str] = Query(None),
     limit: Optional[int] = Query(100),
     skip: Optional[int] = Query(0),
-    db: AsyncSession = Depends(get_db)
+    options: FindOptions = Depends(get_find_options),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Query DropBox objects (POST)"""
-    return await _query_drop_box(where, order, limit, skip, db)
+    return await _query_drop_box(where, order, limit, skip, db, options)
 
 
 @router.post("/DropBox/{object_id}")
@@ -1024,16 +873,7 @@ async def delete_drop_box_post(
     # Handle _method override from Parse SDK
     method = data.get("_method", "POST")
     if method == "DELETE":
-        result = await db.execute(select(DropBox).where(DropBox.objectId == object_id))
-        item = result.scalar_one_or_none()
-
-        if not item:
-            raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
-        await db.delete(item)
-        await db.commit()
-
-        return {}
+        return await run_write(db, _delete_object(DropBox, object_id))
 
     raise HTTPException(status_code=405, detail={"code": 1, "error": "Method not allowed"})
 
@@ -1044,13 +884,4 @@ async def delete_drop_box(
     db: AsyncSession = Depends(get_db)
 ):
     """Delete a DropBox item (after claiming reward)"""
-    result = await db.execute(select(DropBox).where(DropBox.objectId == object_id))
-    item = result.scalar_one_or_none()
-
-    if not item:
-        raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
-
-    await db.delete(item)
-    await db.commit()
-
-    return {}
+    return await run_write(db, _delete_object(DropBox, object_id))
@@ -4,8 +4,9 @@ Parse Config API Router
 """
 from fastapi import APIRouter, Request
 from typing import Dict, Any
+from responses import ParseJSONResponse
 
-router = APIRouter(prefix="/parse", tags=["config"])
+router = APIRouter(prefix="/parse", tags=["config"], default_response_class=ParseJSONResponse)
 
 # 服务器配置参数
 # 这些参数会被客户端用于版本检查等功能
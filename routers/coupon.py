@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Form
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from database import get_db
+from database import get_db, dialect_insert
 from models.coupon import Coupon
 
 
@@ -75,21 +75,23 @@ async def create_coupon(
     db: AsyncSession = Depends(get_db)
 ):
     """Create a new coupon (admin only)"""
-    # Check if coupon code already exists
-    result = await db.execute(select(Coupon).where(Coupon.code == code))
-    if result.scalar_one_or_none():
-        raise HTTPException(status_code=400, detail={"error": "Coupon code already exists"})
-
-    coupon = Coupon(
-        code=code,
-        relics=relics,
-        gems=gems,
-        unlockAdFree=unlock_ad_free,
-        maxRedemptions=max_redemptions
+    # Insert unless the code already exists (ON CONFLICT on the unique code)
+    result = await db.execute(
+        dialect_insert(Coupon)
+        .values(
+            code=code,
+            relics=relics,
+            gems=gems,
+            unlockAdFree=unlock_ad_free,
+            maxRedemptions=max_redemptions
+        )
+        .on_conflict_do_nothing(index_elements=["code"])
+        .returning(Coupon)
     )
-    db.add(coupon)
+    coupon = result.scalar_one_or_none()
+    if not coupon:
+        raise HTTPException(status_code=400, detail={"error": "Coupon code already exists"})
     await db.commit()
-    await db.refresh(coupon)
 
     return coupon.to_dict()
 
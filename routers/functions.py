@@ -1,26 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, and_, desc
+from sqlalchemy import select, or_, and_, desc, case, func
 from typing import Optional
 from pydantic import BaseModel
 
-from database import get_db
+from database import get_db, get_read_db, dialect_insert
 from models.user import User
-from models.friend_relation import FriendRelation
+from models.friend_relation import FriendRelation, friend_pair
 from models.battle_log import BattleLog
 from services.auth import AuthService
+from services.auth_context import AuthContext, get_auth_context, get_current_user
+from services.parse_query import row_columns
+from responses import ParseJSONResponse
 
 
-router = APIRouter(prefix="/parse/functions", tags=["functions"])
-
-
-async def get_current_user(
-    x_parse_session_token: Optional[str] = Header(None, alias="X-Parse-Session-Token"),
-    db: AsyncSession = Depends(get_db)
-) -> Optional[User]:
-    if not x_parse_session_token:
-        return None
-    return await AuthService.get_user_by_session_token(db, x_parse_session_token)
+router = APIRouter(prefix="/parse/functions", tags=["functions"], default_response_class=ParseJSONResponse)
 
 
 class ClearSessionTokenRequest(BaseModel):
@@ -143,102 +137,84 @@ async def link_google_id(
 @router.post("/addFriend")
 async def add_friend(
     request: AddFriendRequest,
-    current_user: Optional[User] = Depends(get_current_user),
+    auth: AuthContext = Depends(get_auth_context),
     db: AsyncSession = Depends(get_db)
 ):
     """Add a friend relationship"""
-    if not current_user:
-        raise HTTPException(status_code=401, detail={"code": 209, "error": "Invalid session token"})
+    current_user_id = await auth.require_user_id()
 
     target_user_id = request.targetUserID
 
     # Check if target user exists
-    result = await db.execute(select(User).where(User.objectId == target_user_id))
-    target_user = result.scalar_one_or_none()
-
-    if not target_user:
+    result = await db.execute(select(User.objectId).where(User.objectId == target_user_id))
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail={"code": 101, "error": "Target user not found"})
 
-    # Check if relationship already exists
+    # The unique pair index makes a concurrent or repeated add a no-op
+    user1_id, user2_id = friend_pair(current_user_id, target_user_id)
     result = await db.execute(
-        select(FriendRelation).where(
-            or_(
-                and_(
-                    FriendRelation.user1Id == current_user.objectId,
-                    FriendRelation.user2Id == target_user_id
-                ),
-                and_(
-                    FriendRelation.user1Id == target_user_id,
-                    FriendRelation.user2Id == current_user.objectId
-                )
-            )
-        )
+        dialect_insert(FriendRelation)
+        .values(user1Id=user1_id, user2Id=user2_id)
+        .on_conflict_do_nothing(index_elements=["user1Id", "user2Id"])
+        .returning(*row_columns(FriendRelation))
     )
-    existing_relation = result.scalar_one_or_none()
+    relation = result.first()
 
-    if existing_relation:
-        return {"result": existing_relation.to_dict()}
+    if relation is None:
+        # Relationship already exists
+        result = await db.execute(
+            select(*row_columns(FriendRelation)).where(
+                FriendRelation.user1Id == user1_id,
+                FriendRelation.user2Id == user2_id
+            )
+        )
+        relation = result.one()
 
-    # Create new friend relation
-    relation = FriendRelation(
-        user1Id=current_user.objectId,
-        user2Id=target_user_id
-    )
-    db.add(relation)
     await db.commit()
-    await db.refresh(relation)
 
-    return {"result": relation.to_dict()}
+    return {"result": FriendRelation.to_dict(relation)}
 
 
 @router.post("/findLatestBattleLogPerFriend")
 async def find_latest_battle_log_per_friend(
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Find the latest battle log for each friend"""
-    if not current_user:
-        raise HTTPException(status_code=401, detail={"code": 209, "error": "Invalid session token"})
+    current_user_id = await auth.require_user_id()
 
-    # Get all friend relations for current user
-    result = await db.execute(
-        select(FriendRelation).where(
-            or_(
-                FriendRelation.user1Id == current_user.objectId,
-                FriendRelation.user2Id == current_user.objectId
-            )
+    # Friend IDs of the current user (the other side of each relation)
+    friend_ids = select(
+        case(
+            (FriendRelation.user1Id == current_user_id, FriendRelation.user2Id),
+            else_=FriendRelation.user1Id
+        )
+    ).where(
+        or_(
+            FriendRelation.user1Id == current_user_id,
+            FriendRelation.user2Id == current_user_id
         )
     )
-    relations = result.scalars().all()
-
-    # Get friend IDs
-    friend_ids = set()
-    for relation in relations:
-        if relation.user1Id == current_user.objectId:
-            friend_ids.add(relation.user2Id)
-        else:
-            friend_ids.add(relation.user1Id)
-
-    if not friend_ids:
-        return {"result": []}
-
-    # For each friend, get the latest battle log
-    latest_logs = []
-    for friend_id in friend_ids:
-        # Get latest battle log where current user is sender and friend is receiver
-        result = await db.execute(
-            select(BattleLog)
-            .where(
-                and_(
-                    BattleLog.senderId == current_user.objectId,
-                    BattleLog.receiverId == friend_id
-                )
+
+    # Latest battle log sent by the current user to each friend, in one query
+    # served by ix_battle_logs_sender_receiver_created
+    ranked = (
+        select(
+            *row_columns(BattleLog),
+            func.row_number().over(
+                partition_by=BattleLog.receiverId,
+                order_by=desc(BattleLog.createdAt)
+            ).label("rank")
+        )
+        .where(
+            and_(
+                BattleLog.senderId == current_user_id,
+                BattleLog.receiverId.in_(friend_ids)
             )
-            .order_by(desc(BattleLog.createdAt))
-            .limit(1)
         )
-        log = result.scalar_one_or_none()
-        if log:
-            latest_logs.append(log)
+        .subquery()
+    )
+    columns = [ranked.c[column.key] for column in BattleLog.__table__.columns]
+    result = await db.execute(select(*columns).where(ranked.c.rank == 1))
 
-    return {"result": [log.to_dict() for log in latest_logs]}
+    return ParseJSONResponse({"result": [BattleLog.to_dict(row) for row in result]})
@@ -5,9 +5,10 @@ from typing import Optional
 
 from database import get_db
 from services.auth import AuthService
+from responses import ParseJSONResponse
 
 
-router = APIRouter(prefix="/parse", tags=["auth"])
+router = APIRouter(prefix="/parse", tags=["auth"], default_response_class=ParseJSONResponse)
 
 
 class LoginRequest(BaseModel):
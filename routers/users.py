@@ -4,13 +4,15 @@ from sqlalchemy import select
 from typing import Optional, Any
 from pydantic import BaseModel
 
-from database import get_db
+from database import get_db, get_read_db
 from models.user import User, format_parse_date
 from services.auth import AuthService
+from services.auth_context import AuthContext, get_auth_context, require_current_user
 from config import settings
+from responses import ParseJSONResponse
 
 
-router = APIRouter(prefix="/parse/users", tags=["users"])
+router = APIRouter(prefix="/parse/users", tags=["users"], default_response_class=ParseJSONResponse)
 
 
 class SignUpRequest(BaseModel):
@@ -27,27 +29,6 @@ class UpdateUserRequest(BaseModel):
     googleUserId: Optional[str] = None
 
 
-async def get_current_user(
-    x_parse_session_token: Optional[str] = Header(None, alias="X-Parse-Session-Token"),
-    db: AsyncSession = Depends(get_db)
-) -> Optional[User]:
-    if not x_parse_session_token:
-        return None
-    return await AuthService.get_user_by_session_token(db, x_parse_session_token)
-
-
-async def require_current_user(
-    x_parse_session_token: Optional[str] = Header(None, alias="X-Parse-Session-Token"),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    if not x_parse_session_token:
-        raise HTTPException(status_code=401, detail={"code": 209, "error": "Invalid session token"})
-    user = await AuthService.get_user_by_session_token(db, x_parse_session_token)
-    if not user:
-        raise HTTPException(status_code=401, detail={"code": 209, "error": "Invalid session token"})
-    return user
-
-
 @router.post("")
 async def sign_up(request: SignUpRequest, db: AsyncSession = Depends(get_db)):
     """Create a new user"""
@@ -80,10 +61,11 @@ async def get_current_user_info(
 @router.get("/{object_id}")
 async def get_user(
     object_id: str,
-    current_user: User = Depends(require_current_user),
-    db: AsyncSession = Depends(get_db)
+    auth: AuthContext = Depends(get_auth_context),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get user by ID"""
+    await auth.require_user_id()
     result = await db.execute(select(User).where(User.objectId == object_id))
     user = result.scalar_one_or_none()
     if not user:
@@ -107,7 +89,7 @@ async def update_user(
     if "username" in data:
         current_user.username = data["username"]
     if "password" in data:
-        current_user.password_hash = AuthService.hash_password(data["password"])
+        current_user.password_hash = await AuthService.hash_password(data["password"])
     if "email" in data:
         current_user.email = data["email"]
     if "googleUserId" in data:
@@ -118,6 +100,6 @@ async def update_user(
             current_user.googleUserId = data["googleUserId"]
 
     await db.commit()
-    await db.refresh(current_user)
+    AuthService.invalidate_cached_user(current_user.objectId)
 
     return {"updatedAt": format_parse_date(current_user.updatedAt)}
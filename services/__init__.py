@@ -1,4 +1,5 @@
 # Services package
 from services.auth import AuthService
+from services.auth_context import AuthContext
 
-__all__ = ["AuthService"]
+__all__ = ["AuthService", "AuthContext"]
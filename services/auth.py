@@ -2,31 +2,145 @@ from datetime import datetime, timedelta, timezone
 from typing import Optional
 import secrets
 import uuid
-import hashlib
+import time
 
+from jose import jwt, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
 
+from database import dialect_insert
 from models.user import User, Session
 from models.user_summary import UserSummary
+from services import passwords
+from services.session_cache import session_cache
+from services.revocation import revocation_list
 from config import settings
 
 
+SIGNED_TOKEN_PREFIX = "s:"
+
+
 class AuthService:
     @staticmethod
-    def hash_password(password: str) -> str:
-        """Hash password using SHA256 (matching User model)"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    async def hash_password(password: str) -> str:
+        """Hash password with the configured scheme on the hashing thread pool"""
+        return await passwords.hash_password(password)
+
+    @staticmethod
+    async def verify_password(plain_password: str, hashed_password: str) -> bool:
+        """Verify password against a hash of any registered scheme"""
+        matches, _ = await passwords.verify_password(plain_password, hashed_password)
+        return matches
 
     @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        """Verify password using SHA256 (matching User model)"""
-        return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
+    async def _authenticate(user: User, password: str) -> bool:
+        """Verify a user's password, upgrading a legacy hash in place on success
+
+        The upgraded hash is committed with whatever the caller commits next.
+        """
+        matches, new_hash = await passwords.verify_password(password, user.password_hash)
+        if matches and new_hash:
+            user.password_hash = new_hash
+        return matches
 
     @staticmethod
     def generate_session_token() -> str:
         return f"r:{secrets.token_hex(24)}"
 
+    @staticmethod
+    def generate_signed_session_token(user_id: str, expires_at: datetime) -> str:
+        """Issue an HMAC-signed token carrying userId and expiry"""
+        claims = {
+            "sub": user_id,
+            "iat": time.time(),
+            "exp": int(expires_at.timestamp()),
+            "jti": secrets.token_hex(8),
+        }
+        return SIGNED_TOKEN_PREFIX + jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+    @staticmethod
+    def decode_signed_session_token(session_token: str) -> Optional[dict]:
+        """Return the claims of a valid, unexpired signed token, or None"""
+        try:
+            claims = jwt.decode(
+                session_token[len(SIGNED_TOKEN_PREFIX):],
+                settings.SECRET_KEY,
+                algorithms=[settings.ALGORITHM]
+            )
+        except JWTError:
+            return None
+        if not claims.get("sub"):
+            return None
+        return claims
+
+    @staticmethod
+    async def issue_session(db: AsyncSession, user_id: str, new_user: bool = False) -> str:
+        """Create a session for the user and return its token (caller commits)
+
+        In "signed" mode nothing is written; otherwise a Session row is added
+        and, if MAX_SESSIONS_PER_USER is set, the user's oldest sessions beyond
+        the cap are deleted in the same transaction. A user created in this
+        transaction (new_user) has no sessions to look for.
+        """
+        expires_at = datetime.now(timezone.utc) + timedelta(days=settings.ACCESS_TOKEN_EXPIRE_DAYS)
+        if settings.SESSION_TOKEN_MODE == "signed":
+            return AuthService.generate_signed_session_token(user_id, expires_at)
+
+        if settings.MAX_SESSIONS_PER_USER > 0 and not new_user:
+            await AuthService._evict_oldest_sessions(db, user_id, settings.MAX_SESSIONS_PER_USER - 1)
+
+        session_token = AuthService.generate_session_token()
+        db.add(Session(
+            sessionToken=session_token,
+            userId=user_id,
+            expiresAt=expires_at
+        ))
+        return session_token
+
+    @staticmethod
+    async def _evict_oldest_sessions(db: AsyncSession, user_id: str, keep: int):
+        """Delete all but the newest `keep` sessions of a user (caller commits)"""
+        result = await db.execute(
+            select(Session.id, Session.sessionToken)
+            .where(Session.userId == user_id)
+            .order_by(Session.createdAt.desc())
+            .offset(keep)
+        )
+        evicted = result.all()
+        if not evicted:
+            return
+
+        await db.execute(delete(Session).where(Session.id.in_([row.id for row in evicted])))
+        for row in evicted:
+            session_cache.invalidate_token(row.sessionToken)
+
+    @staticmethod
+    async def insert_user_if_absent(
+        db: AsyncSession,
+        username: str,
+        password_hash: str,
+        email: Optional[str] = None,
+        google_user_id: Optional[str] = None
+    ) -> Optional[User]:
+        """Insert a user unless the username is taken (caller commits)
+
+        Uses INSERT ... ON CONFLICT DO NOTHING RETURNING, so the existence check
+        and the insert are a single statement. Returns None if the name is taken.
+        """
+        result = await db.execute(
+            dialect_insert(User)
+            .values(
+                username=username,
+                password_hash=password_hash,
+                email=email,
+                googleUserId=google_user_id
+            )
+            .on_conflict_do_nothing(index_elements=["username"])
+            .returning(User)
+        )
+        return result.scalar_one_or_none()
+
     @staticmethod
     async def create_user(
         db: AsyncSession,
@@ -36,29 +150,18 @@ class AuthService:
         google_user_id: Optional[str] = None
     ) -> tuple[User, str]:
         """Create a new user and return the user with session token"""
-        # Check if username already exists
-        result = await db.execute(select(User).where(User.username == username))
-        if result.scalar_one_or_none():
-            raise ValueError("Username already exists")
-
-        # Create user
-        user = User(
+        user = await AuthService.insert_user_if_absent(
+            db,
             username=username,
-            password_hash=AuthService.hash_password(password),
+            password_hash=await AuthService.hash_password(password),
             email=email,
-            googleUserId=google_user_id
+            google_user_id=google_user_id
         )
-        db.add(user)
-        await db.flush()
+        if not user:
+            raise ValueError("Username already exists")
 
         # Create session
-        session_token = AuthService.generate_session_token()
-        session = Session(
-            sessionToken=session_token,
-            userId=user.objectId,
-            expiresAt=datetime.now(timezone.utc) + timedelta(days=settings.ACCESS_TOKEN_EXPIRE_DAYS)
-        )
-        db.add(session)
+        session_token = await AuthService.issue_session(db, user.objectId, new_user=True)
 
         # Create user summary
         user_summary = UserSummary(
@@ -73,7 +176,6 @@ class AuthService:
         db.add(user_summary)
 
         await db.commit()
-        await db.refresh(user)
 
         return user, session_token
 
@@ -91,24 +193,32 @@ class AuthService:
         )
         user = result.scalar_one_or_none()
 
-        if not user or not AuthService.verify_password(password, user.password_hash):
+        if not user or not await AuthService._authenticate(user, password):
             raise ValueError("Invalid username or password")
 
         # Create new session
-        session_token = AuthService.generate_session_token()
-        session = Session(
-            sessionToken=session_token,
-            userId=user.objectId,
-            expiresAt=datetime.now(timezone.utc) + timedelta(days=settings.ACCESS_TOKEN_EXPIRE_DAYS)
-        )
-        db.add(session)
+        session_token = await AuthService.issue_session(db, user.objectId)
         await db.commit()
 
         return user, session_token
 
     @staticmethod
-    async def get_user_by_session_token(db: AsyncSession, session_token: str) -> Optional[User]:
-        """Get user by session token"""
+    async def get_user_id_by_session_token(db: AsyncSession, session_token: str) -> Optional[str]:
+        """Resolve a session token to its userId
+
+        Signed tokens are verified locally against the revocation list; legacy
+        r: tokens go through the in-process session cache, then the database.
+        """
+        if session_token.startswith(SIGNED_TOKEN_PREFIX):
+            claims = AuthService.decode_signed_session_token(session_token)
+            if not claims or revocation_list.is_revoked(claims.get("jti"), claims["sub"], claims.get("iat", 0)):
+                return None
+            return claims["sub"]
+
+        cached = session_cache.get(session_token)
+        if cached:
+            return cached[0]
+
         result = await db.execute(
             select(Session).where(Session.sessionToken == session_token)
         )
@@ -124,16 +234,44 @@ class AuthService:
             if expires_at.tzinfo is None:
                 expires_at = expires_at.replace(tzinfo=timezone.utc)
             if expires_at < datetime.now(timezone.utc):
-                await db.delete(session)
-                await db.commit()
+                # Expired rows are removed by the background session sweeper
                 return None
 
-        result = await db.execute(select(User).where(User.objectId == session.userId))
-        return result.scalar_one_or_none()
+        session_cache.put(session_token, session.userId, session.expiresAt)
+        return session.userId
+
+    @staticmethod
+    async def get_user_by_session_token(db: AsyncSession, session_token: str) -> Optional[User]:
+        """Get user by session token"""
+        user_id = await AuthService.get_user_id_by_session_token(db, session_token)
+        if not user_id:
+            return None
+
+        user = await db.get(User, user_id)
+        if not user:
+            session_cache.invalidate_user(user_id)
+        return user
+
+    @staticmethod
+    def invalidate_cached_user(user_id: str):
+        """Drop cached session lookups for a user (call after the user row changes)"""
+        session_cache.invalidate_user(user_id)
 
     @staticmethod
     async def logout(db: AsyncSession, session_token: str) -> bool:
-        """Logout user by deleting session"""
+        """Logout user by deleting session (or revoking a signed token)"""
+        if session_token.startswith(SIGNED_TOKEN_PREFIX):
+            claims = AuthService.decode_signed_session_token(session_token)
+            if not claims or not claims.get("jti"):
+                return False
+            await revocation_list.revoke_token(
+                db,
+                claims["jti"],
+                claims["sub"],
+                datetime.fromtimestamp(claims["exp"], tz=timezone.utc)
+            )
+            return True
+
         result = await db.execute(
             select(Session).where(Session.sessionToken == session_token)
         )
@@ -142,7 +280,9 @@ class AuthService:
         if session:
             await db.delete(session)
             await db.commit()
+            session_cache.invalidate_token(session_token)
             return True
+        session_cache.invalidate_token(session_token)
         return False
 
     @staticmethod
@@ -165,11 +305,13 @@ class AuthService:
             return True
 
         # If user exists, verify password
-        if not AuthService.verify_password(password, user.password_hash):
+        if not await AuthService._authenticate(user, password):
             raise ValueError("Invalid username or password")
 
         await db.execute(delete(Session).where(Session.userId == user.objectId))
-        await db.commit()
+        # Commits the Session delete together with the signed-token revocation
+        await revocation_list.revoke_user(db, user.objectId)
+        session_cache.invalidate_user(user.objectId)
         return True
 
     @staticmethod
@@ -180,28 +322,23 @@ class AuthService:
 
     @staticmethod
     async def link_google_account(db: AsyncSession, user: User, google_user_id: str) -> User:
-        """Link Google account to user"""
-        # Check if Google ID is already linked to another user
-        result = await db.execute(select(User).where(User.googleUserId == google_user_id))
-        existing_user = result.scalar_one_or_none()
-
-        if existing_user and existing_user.objectId != user.objectId:
-            raise ValueError("Google account already linked to another user")
+        """Link Google account to user
 
+        googleUserId is unique, so a Google ID linked to another user fails
+        the UPDATE itself instead of needing a lookup first.
+        """
         user.googleUserId = google_user_id
-        await db.commit()
-        await db.refresh(user)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            raise ValueError("Google account already linked to another user")
+        session_cache.invalidate_user(user.objectId)
         return user
 
     @staticmethod
     async def create_session_for_user(db: AsyncSession, user: User) -> str:
         """Create a new session for user and return session token"""
-        session_token = AuthService.generate_session_token()
-        session = Session(
-            sessionToken=session_token,
-            userId=user.objectId,
-            expiresAt=datetime.now(timezone.utc) + timedelta(days=settings.ACCESS_TOKEN_EXPIRE_DAYS)
-        )
-        db.add(session)
+        session_token = await AuthService.issue_session(db, user.objectId)
         await db.commit()
         return session_token
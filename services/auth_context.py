@@ -0,0 +1,73 @@
+from fastapi import Depends, Header, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from database import get_db
+from models.user import User
+from services.auth import AuthService
+
+
+_UNRESOLVED = object()
+
+
+class AuthContext:
+    """Request-scoped view of the X-Parse-Session-Token caller
+
+    Nothing is looked up until a handler asks for the user, and the lookup
+    runs at most once per request. FastAPI caches dependencies per request,
+    so every handler, sub-dependency and batch sub-operation that depends on
+    get_auth_context shares the same instance.
+    """
+
+    def __init__(self, db: AsyncSession, session_token: Optional[str]):
+        self.db = db
+        self.session_token = session_token
+        self._user_id = _UNRESOLVED
+        self._user = _UNRESOLVED
+
+    async def get_user_id(self) -> Optional[str]:
+        """Resolve the caller's objectId without loading the User row when possible"""
+        if self._user_id is _UNRESOLVED:
+            if not self.session_token:
+                self._user_id = None
+            else:
+                self._user_id = await AuthService.get_user_id_by_session_token(self.db, self.session_token)
+        return self._user_id
+
+    async def get_user(self) -> Optional[User]:
+        if self._user is _UNRESOLVED:
+            user_id = await self.get_user_id()
+            if not user_id:
+                self._user = None
+            else:
+                self._user = await self.db.get(User, user_id)
+                if not self._user:
+                    AuthService.invalidate_cached_user(user_id)
+        return self._user
+
+    async def require_user_id(self) -> str:
+        user_id = await self.get_user_id()
+        if not user_id:
+            raise HTTPException(status_code=401, detail={"code": 209, "error": "Invalid session token"})
+        return user_id
+
+    async def require_user(self) -> User:
+        user = await self.get_user()
+        if not user:
+            raise HTTPException(status_code=401, detail={"code": 209, "error": "Invalid session token"})
+        return user
+
+
+async def get_auth_context(
+    x_parse_session_token: Optional[str] = Header(None, alias="X-Parse-Session-Token"),
+    db: AsyncSession = Depends(get_db)
+) -> AuthContext:
+    return AuthContext(db, x_parse_session_token)
+
+
+async def get_current_user(auth: AuthContext = Depends(get_auth_context)) -> Optional[User]:
+    return await auth.get_user()
+
+
+async def require_current_user(auth: AuthContext = Depends(get_auth_context)) -> User:
+    return await auth.require_user()
@@ -0,0 +1,233 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import logging
+
+from fastapi import HTTPException
+from sqlalchemy import select, insert, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session
+from models.game_data import GameData, SAVE_DATA_COLUMNS, encode_save_data, parse_save_object, save_data_hash
+from models.game_data_history import GameDataHistory
+from services.save_history import save_history
+from models.user import format_parse_date
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class SaveStats:
+    """Counts GameData saves and how many were skipped as unchanged"""
+
+    def __init__(self):
+        self.saves = 0
+        self.unchanged = 0
+
+    def record(self, changed: bool):
+        self.saves += 1
+        if not changed:
+            self.unchanged += 1
+
+    def stats(self) -> dict:
+        return {
+            "saves": self.saves,
+            "unchanged": self.unchanged,
+            "skipRatio": round(self.unchanged / self.saves, 4) if self.saves else 0.0,
+        }
+
+
+save_stats = SaveStats()
+
+
+@dataclass
+class _PendingSave:
+    data: Optional[str]
+    data_hash: Optional[str]
+    updated_at: datetime
+
+
+class GameDataBuffer:
+    """Write-behind buffer for GameData cloud saves
+
+    Each save replaces the pending save of the same objectId in memory and
+    returns immediately; the latest version of each object is written in one
+    executemany UPDATE every GAME_DATA_FLUSH_INTERVAL_SECONDS, or as soon as
+    GAME_DATA_MAX_PENDING objects are waiting. Saves replaced before they
+    were flushed are counted as coalesced.
+
+    Query results are overlaid with pending saves (see overlay), so clients
+    read what they wrote. Filters and sort order on updatedAt still see the
+    stored row until the next flush. A save identical to the pending or the
+    stored version is not buffered at all.
+    """
+
+    def __init__(self, flush_interval_seconds: float, max_pending: int):
+        self.flush_interval = flush_interval_seconds
+        self.max_pending = max_pending
+        self._pending: dict[str, _PendingSave] = {}
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.saves = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self):
+        """Stop the flusher, then write every pending save"""
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def save(self, db: AsyncSession, object_id: str, data: Optional[str]) -> dict:
+        """Buffer a save and return the Parse update response (404 if the object is missing)"""
+        data_hash = save_data_hash(data)
+        pending = self._pending.get(object_id)
+        if pending is None:
+            result = await db.execute(
+                select(GameData.updatedAt, GameData.dataHash).where(GameData.objectId == object_id)
+            )
+            stored = result.first()
+            if stored is None:
+                raise HTTPException(status_code=404, detail={"code": 101, "error": "Object not found"})
+            if data_hash is not None and stored.dataHash == data_hash:
+                save_stats.record(changed=False)
+                return {"updatedAt": format_parse_date(stored.updatedAt)}
+        elif pending.data_hash == data_hash:
+            save_stats.record(changed=False)
+            return {"updatedAt": format_parse_date(pending.updated_at)}
+        else:
+            self.coalesced += 1
+
+        updated_at = datetime.now(timezone.utc)
+        self._pending[object_id] = _PendingSave(data, data_hash, updated_at)
+        self.saves += 1
+        save_stats.record(changed=True)
+        if len(self._pending) >= self.max_pending:
+            self._flush_requested.set()
+        return {"updatedAt": format_parse_date(updated_at)}
+
+    def overlay(self, response: dict) -> dict:
+        """Replace a serialized GameData's data/updatedAt with its pending save"""
+        pending = self._pending.get(response["objectId"])
+        if pending is not None:
+            response["data"] = pending.data
+            response["updatedAt"] = format_parse_date(pending.updated_at)
+        return response
+
+    async def flush(self) -> int:
+        """Write all pending saves in one transaction and return how many
+
+        Saves stay pending (and overlaid on reads) until the transaction has
+        committed; only those not replaced by a newer save meanwhile are
+        dropped then, and none are if the write fails.
+        """
+        async with self._flush_lock:
+            pending = dict(self._pending)
+            if not pending:
+                return 0
+            try:
+                async with async_session() as db:
+                    table = GameData.__table__
+                    connection = await db.connection()
+                    versions = {}
+                    if save_history.enabled:
+                        result = await connection.execute(
+                            select(table.c.objectId, table.c.userId, table.c.historyVersion)
+                            .where(table.c.objectId.in_(pending))
+                        )
+                        versions = {row.objectId: row for row in result}
+
+                    # Each surviving save is parsed once, for its columns and its history row
+                    states = {object_id: parse_save_object(save.data) for object_id, save in pending.items()}
+                    values = {key: bindparam(f"b_{key}") for key in SAVE_DATA_COLUMNS + ("updatedAt",)}
+                    if save_history.enabled:
+                        values["historyVersion"] = bindparam("b_historyVersion")
+                    await connection.execute(
+                        table.update().where(table.c.objectId == bindparam("b_objectId")).values(**values),
+                        [
+                            {
+                                "b_objectId": object_id,
+                                "b_updatedAt": save.updated_at,
+                                "b_historyVersion": (
+                                    (versions[object_id].historyVersion or 0) + 1 if object_id in versions else None
+                                ),
+                                # Only the surviving save of each object is compressed
+                                **{
+                                    f"b_{key}": value
+                                    for key, value in encode_save_data(save.data, states[object_id]).items()
+                                }
+                            }
+                            for object_id, save in pending.items()
+                        ]
+                    )
+                    if versions:
+                        # One history row per flushed object, not per coalesced save
+                        await connection.execute(insert(GameDataHistory), [
+                            save_history.entry(
+                                db,
+                                object_id,
+                                row.userId,
+                                (row.historyVersion or 0) + 1,
+                                pending[object_id].data,
+                                states[object_id]
+                            )
+                            for object_id, row in versions.items()
+                        ])
+                    await db.commit()
+            except Exception:
+                self.failed_flushes += 1
+                raise
+
+            for object_id, save in pending.items():
+                # Every save is a new _PendingSave, so identity tells if it was replaced
+                if self._pending.get(object_id) is save:
+                    del self._pending[object_id]
+            self.flushes += 1
+            self.flushed_rows += len(pending)
+            return len(pending)
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"GameData flush failed: {type(e).__name__}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "pending": len(self._pending),
+            "saves": self.saves,
+            "coalesced": self.coalesced,
+            "coalescedRatio": round(self.coalesced / self.saves, 4) if self.saves else 0.0,
+            "flushes": self.flushes,
+            "flushedRows": self.flushed_rows,
+            "failedFlushes": self.failed_flushes,
+        }
+
+
+game_data_buffer = GameDataBuffer(settings.GAME_DATA_FLUSH_INTERVAL_SECONDS, settings.GAME_DATA_MAX_PENDING)
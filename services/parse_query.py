@@ -0,0 +1,755 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Optional
+import base64
+import json
+
+from fastapi import HTTPException, Query
+from sqlalchemy import Boolean, DateTime, Integer, select, func, null, and_, or_, asc, desc, true, false, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from config import settings
+from database import engine
+from models.user import User
+from models.user_summary import UserSummary
+from models.game_data import GameData
+from models.friend_relation import FriendRelation
+from models.battle_log import BattleLog
+from models.notice import Notice
+from models.drop_box import DropBox
+from responses import dumps
+from services.game_data_buffer import game_data_buffer
+
+
+# Parse error codes
+INVALID_QUERY = 102
+INVALID_KEY_NAME = 105
+
+
+def invalid_query(message: str) -> HTTPException:
+    return HTTPException(status_code=400, detail={"code": INVALID_QUERY, "error": message})
+
+
+def parse_pointer(pointer: Any) -> Optional[str]:
+    """Extract objectId from a Parse Pointer or return None for null values"""
+    if pointer is None:
+        return None
+    if isinstance(pointer, dict) and pointer.get("__type") == "Pointer":
+        return pointer.get("objectId")
+    if isinstance(pointer, str):
+        return pointer
+    return None
+
+
+def parse_date(date_obj: Any) -> Optional[datetime]:
+    """Parse a Parse Date object"""
+    if isinstance(date_obj, dict) and date_obj.get("__type") == "Date":
+        iso_str = date_obj.get("iso", "")
+        if iso_str:
+            try:
+                iso_str = iso_str.replace("Z", "+00:00")
+                return datetime.fromisoformat(iso_str)
+            except:
+                pass
+    return None
+
+
+class ParseField:
+    """A queryable Parse key backed by one or more columns
+
+    A pointer key may span several columns (FriendRelation.users is stored as
+    user1Id/user2Id); it matches if any of them does.
+    """
+
+    def __init__(self, name: str, columns: tuple, target: Optional[str] = None):
+        self.name = name
+        self.columns = columns
+        # Parse class a pointer key refers to (None for plain columns)
+        self.target = target
+        self.pointer = target is not None
+        column_type = columns[0].type
+        self.is_boolean = isinstance(column_type, Boolean)
+        self.is_date = isinstance(column_type, DateTime)
+
+    def coerce(self, value: Any) -> Any:
+        """Convert a Parse JSON value to the Python value bound for this key"""
+        if self.pointer:
+            object_id = parse_pointer(value)
+            if object_id is None:
+                raise invalid_query(f"Invalid pointer for key {self.name}")
+            return object_id
+        if self.is_date:
+            if isinstance(value, str):
+                value = {"__type": "Date", "iso": value}
+            parsed = parse_date(value)
+            if parsed is None:
+                raise invalid_query(f"Invalid date for key {self.name}")
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return parsed.astimezone(timezone.utc)
+        if isinstance(value, (dict, list)):
+            raise invalid_query(f"Invalid value for key {self.name}")
+        return value
+
+
+class ParseClass:
+    """Queryable Parse class: its keys, sort keys and fixed filters
+
+    Every mapped column is queryable under its own name except `hidden` ones;
+    `pointers` maps Parse pointer keys to their id columns. Sort keys are
+    limited to objectId, columns that appear in an index and `extra_order`,
+    so clients cannot force a sort over an unindexed column. `heavy` columns
+    (large text blobs) are only read when a `keys` projection asks for them.
+    `storage` maps a key to further columns it is stored in; those are not
+    queryable and are skipped together with their key.
+    `serializer` is called unbound on the Core rows built by row_columns().
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model,
+        pointers: Optional[dict] = None,
+        serializer: Optional[Callable] = None,
+        hidden: tuple = (),
+        heavy: tuple = (),
+        storage: Optional[dict] = None,
+        extra_order: tuple = (),
+        default_order: Optional[str] = None,
+        base_criteria: Optional[Callable] = None
+    ):
+        self.name = name
+        self.model = model
+        self.default_order = default_order
+        self.base_criteria = base_criteria
+        self.heavy = heavy
+        self.hidden = hidden
+        self.storage = storage or {}
+        self.serializer = serializer or model.to_dict
+
+        pointers = pointers or {}
+        pointer_columns = {column.key for columns in pointers.values() for column in columns}
+        storage_columns = {key for keys in self.storage.values() for key in keys}
+        self.fields: dict[str, ParseField] = {
+            # Every pointer in this schema refers to _User
+            key: ParseField(key, columns, target="_User") for key, columns in pointers.items()
+        }
+        for column in model.__table__.columns:
+            if column.key not in pointer_columns | storage_columns and column.key not in hidden:
+                self.fields[column.key] = ParseField(column.key, (getattr(model, column.key),))
+
+        indexed = {column.key for index in model.__table__.indexes for column in index.columns}
+        indexed |= {column.key for column in model.__table__.primary_key.columns}
+        indexed |= {column.key for column in model.__table__.columns if column.unique}
+        self.order_keys = {
+            key for key, field in self.fields.items()
+            if all(column.key in indexed for column in field.columns) and len(field.columns) == 1
+        } | set(extra_order)
+
+    def field(self, key: str) -> ParseField:
+        field = self.fields.get(key)
+        if field is None:
+            raise invalid_query(f"Invalid key {key} for class {self.name}")
+        return field
+
+    def parse_order(self, order: Optional[str]) -> tuple:
+        """Validate a Parse order string ("-createdAt,objectId") into ((key, descending), ...)"""
+        order = order or self.default_order
+        if not order:
+            return ()
+        keys = []
+        for part in order.split(","):
+            part = part.strip()
+            descending = part.startswith("-")
+            key = part[1:] if descending else part
+            if key not in self.order_keys:
+                raise HTTPException(
+                    status_code=400,
+                    detail={"code": INVALID_KEY_NAME, "error": f"Cannot sort {self.name} by {key}"}
+                )
+            keys.append((key, descending))
+        return tuple(keys)
+
+    def parse_keys(self, keys: Optional[str]) -> Optional[frozenset]:
+        """Validate a Parse keys projection ("data,user") into a set of keys"""
+        if keys is None:
+            return None
+        selected = set()
+        for key in keys.split(","):
+            # "user.displayName" selects the pointer itself
+            key = key.strip().split(".")[0]
+            if key:
+                self.field(key)
+                selected.add(key)
+        return frozenset(selected)
+
+    def parse_include(self, include: Optional[str]) -> tuple:
+        """Validate a Parse include list ("sender,receiver") into pointer keys"""
+        if not include:
+            return ()
+        keys = []
+        for key in include.split(","):
+            key = key.strip()
+            if not key:
+                continue
+            if "." in key:
+                raise invalid_query(f"Nested include {key} is not supported")
+            if not self.field(key).pointer:
+                raise invalid_query(f"Cannot include {key}: not a pointer")
+            if key not in keys:
+                keys.append(key)
+        return tuple(keys)
+
+
+PARSE_CLASSES: dict[str, ParseClass] = {}
+
+
+def register_class(parse_class: ParseClass):
+    PARSE_CLASSES[parse_class.name] = parse_class
+
+
+register_class(ParseClass("_User", User, serializer=User.to_parse_response, hidden=("password_hash",)))
+register_class(ParseClass("UserSummary", UserSummary, pointers={"user": (UserSummary.userId,)}))
+register_class(ParseClass(
+    "GameData", GameData,
+    pointers={"user": (GameData.userId,)},
+    hidden=("historyVersion",),
+    heavy=("data",),
+    # Compressed saves live in dataBlob/dataCodec (see encode_save_data)
+    storage={"data": ("dataBlob", "dataCodec", "dataHash")},
+    # Saves still waiting in the write-behind buffer win over the stored row
+    serializer=lambda row: game_data_buffer.overlay(GameData.to_dict(row))
+))
+register_class(ParseClass(
+    "FriendRelation", FriendRelation,
+    pointers={"users": (FriendRelation.user1Id, FriendRelation.user2Id)}
+))
+register_class(ParseClass(
+    "BattleLog", BattleLog,
+    pointers={"sender": (BattleLog.senderId,), "receiver": (BattleLog.receiverId,)}
+))
+register_class(ParseClass(
+    "Notice", Notice,
+    heavy=("text",),
+    # Small admin-managed table, sorted by its display order
+    extra_order=("order", "createdAt"),
+    default_order="order",
+    # Notices with an empty imageURL cause the client to hang
+    base_criteria=lambda: and_(Notice.imageURL != None, Notice.imageURL != "")
+))
+register_class(ParseClass("DropBox", DropBox, pointers={"user": (DropBox.userId,)}, heavy=("title",)))
+
+
+# ---------------------------------------------------------------------------
+# where -> shape
+#
+# A where object is first reduced to a hashable "shape" (its keys, operators
+# and null/boolean literals) plus a dict of bound values. Statements are
+# built from shapes and cached, so queries that differ only in their values
+# reuse one Select.
+# ---------------------------------------------------------------------------
+
+_COMPARISONS = {"$gt", "$gte", "$lt", "$lte"}
+
+
+def _bind(params: dict, value: Any) -> str:
+    name = f"p{len(params)}"
+    params[name] = value
+    return name
+
+
+def _constraint_shape(field: ParseField, op: str, value: Any, params: dict) -> tuple:
+    if op in ("$eq", "$ne"):
+        if value is None:
+            return ("null", field.name, op == "$eq")
+        if field.is_boolean and isinstance(value, bool):
+            # Booleans stay SQL literals so partial indexes can match them
+            return ("bool", field.name, value if op == "$eq" else not value)
+        return (op, field.name, _bind(params, field.coerce(value)))
+    if op in ("$in", "$nin"):
+        if not isinstance(value, list):
+            raise invalid_query(f"{op} requires an array")
+        return (op, field.name, _bind(params, [field.coerce(item) for item in value]))
+    if op in _COMPARISONS:
+        if value is None:
+            raise invalid_query(f"{op} requires a value")
+        return (op, field.name, _bind(params, field.coerce(value)))
+    if op == "$exists":
+        if not isinstance(value, bool):
+            raise invalid_query("$exists requires a boolean")
+        return ("null", field.name, not value)
+    raise invalid_query(f"Unsupported operator {op}")
+
+
+def _where_shape(parse_class: ParseClass, where: dict, params: dict) -> tuple:
+    terms = []
+    for key in sorted(where):
+        value = where[key]
+        if key == "$or":
+            if not isinstance(value, list) or not value or not all(isinstance(w, dict) for w in value):
+                raise invalid_query("$or requires a non-empty array of queries")
+            terms.append(("$or", tuple(_where_shape(parse_class, sub, params) for sub in value)))
+            continue
+        if key.startswith("$"):
+            raise invalid_query(f"Unsupported operator {key}")
+
+        if key not in parse_class.fields and settings.QUERY_IGNORE_UNKNOWN_KEYS:
+            # Older servers only filtered on the keys they knew; clients rely on it
+            continue
+        field = parse_class.field(key)
+        if isinstance(value, dict) and "__type" not in value:
+            if not value:
+                raise invalid_query(f"Empty constraint for key {key}")
+            for op in sorted(value):
+                terms.append(_constraint_shape(field, op, value[op], params))
+        else:
+            terms.append(_constraint_shape(field, "$eq", value, params))
+    return ("$and", tuple(terms))
+
+
+# ---------------------------------------------------------------------------
+# shape -> SQL
+# ---------------------------------------------------------------------------
+
+def _any_column(field: ParseField, build) -> Any:
+    clauses = [build(column) for column in field.columns]
+    return clauses[0] if len(clauses) == 1 else or_(*clauses)
+
+
+def _no_column(field: ParseField, build) -> Any:
+    clauses = [build(column) for column in field.columns]
+    return clauses[0] if len(clauses) == 1 else and_(*clauses)
+
+
+def _not_equal(column, clause):
+    # Parse $ne/$nin also match objects where the key is unset
+    return or_(column == None, clause) if column.nullable else clause
+
+
+def _criteria(parse_class: ParseClass, shape: tuple):
+    kind = shape[0]
+    if kind == "$and":
+        return and_(true(), *[_criteria(parse_class, term) for term in shape[1]])
+    if kind == "$or":
+        return or_(*[_criteria(parse_class, term) for term in shape[1]])
+
+    field = parse_class.fields[shape[1]]
+    if kind == "null":
+        if shape[2]:
+            return _no_column(field, lambda c: c == None)
+        return _any_column(field, lambda c: c != None)
+    if kind == "bool":
+        return _any_column(field, lambda c: c == (true() if shape[2] else false()))
+
+    name = shape[2]
+    if kind == "$eq":
+        return _any_column(field, lambda c: c == bindparam(name, type_=c.type))
+    if kind == "$ne":
+        return _no_column(field, lambda c: _not_equal(c, c != bindparam(name, type_=c.type)))
+    if kind == "$in":
+        return _any_column(field, lambda c: c.in_(bindparam(name, expanding=True, type_=c.type)))
+    if kind == "$nin":
+        return _no_column(
+            field, lambda c: _not_equal(c, c.not_in(bindparam(name, expanding=True, type_=c.type)))
+        )
+    if kind == "$gt":
+        return _any_column(field, lambda c: c > bindparam(name, type_=c.type))
+    if kind == "$gte":
+        return _any_column(field, lambda c: c >= bindparam(name, type_=c.type))
+    if kind == "$lt":
+        return _any_column(field, lambda c: c < bindparam(name, type_=c.type))
+    if kind == "$lte":
+        return _any_column(field, lambda c: c <= bindparam(name, type_=c.type))
+    raise ValueError(f"Unknown shape {kind}")
+
+
+# ---------------------------------------------------------------------------
+# Keyset pagination
+#
+# In cursor mode the sort always ends with objectId, and a continuation
+# token carries the sort values of the last row. The next page starts
+# strictly after that row, so its cost does not grow with the page number
+# the way OFFSET does.
+# ---------------------------------------------------------------------------
+
+def _always_set(column) -> bool:
+    # createdAt/updatedAt are declared nullable but always get a default
+    return not column.nullable or column.default is not None
+
+
+def _after(column, name: str, value_is_null: bool, descending: bool):
+    """Rows sorting strictly after the cursor value for one sort column"""
+    # SQLite sorts NULL lowest, PostgreSQL highest
+    nulls_low = engine.dialect.name != "postgresql"
+    nulls_after = nulls_low == descending
+    if value_is_null:
+        return false() if nulls_after else column != None
+    value = bindparam(name, type_=column.type)
+    clause = column < value if descending else column > value
+    if nulls_after and not _always_set(column):
+        clause = or_(clause, column == None)
+    return clause
+
+
+def _keyset_criteria(parse_class: ParseClass, order: tuple, null_values: tuple):
+    """(k1, k2, ...) > (v1, v2, ...) in the query's sort order"""
+    clauses = []
+    for index, (key, descending) in enumerate(order):
+        column = parse_class.fields[key].columns[0]
+        equal = []
+        for prev_index, (prev_key, _) in enumerate(order[:index]):
+            prev_column = parse_class.fields[prev_key].columns[0]
+            if null_values[prev_index]:
+                equal.append(prev_column == None)
+            else:
+                equal.append(prev_column == bindparam(f"c{prev_index}", type_=prev_column.type))
+        clauses.append(and_(*equal, _after(column, f"c{index}", null_values[index], descending)))
+    return or_(*clauses)
+
+
+def _encode_cursor(order: tuple, values: list) -> str:
+    payload = {
+        "o": [("-" if descending else "") + key for key, descending in order],
+        "v": [value.isoformat() if isinstance(value, datetime) else value for value in values],
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(parse_class: ParseClass, order: tuple, cursor: str) -> list:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        keys = payload["o"]
+        values = payload["v"]
+    except (ValueError, TypeError, KeyError):
+        raise invalid_query("Invalid cursor")
+    if keys != [("-" if descending else "") + key for key, descending in order] or len(values) != len(order):
+        raise invalid_query("Cursor does not match the query order")
+
+    return [_cursor_value(parse_class.fields[key], value) for (key, _), value in zip(order, values)]
+
+
+def _cursor_value(field: ParseField, value: Any) -> Any:
+    """A decoded cursor value, checked against its column like _encode_cursor wrote it
+
+    Cursors come back from clients, so a value of the wrong type must be a
+    102, not a driver error when it is bound.
+    """
+    if value is None:
+        return None
+    if field.is_date:
+        if not isinstance(value, str):
+            raise invalid_query("Invalid cursor")
+        try:
+            return field.coerce(value)
+        except HTTPException:
+            raise invalid_query("Invalid cursor")
+    try:
+        expected = field.columns[0].type.python_type
+    except NotImplementedError:
+        expected = (str, int, float)
+    if expected is float:
+        expected = (int, float)
+    if not isinstance(value, expected) or (isinstance(value, bool) and expected is int):
+        raise invalid_query("Invalid cursor")
+    return value
+
+
+def row_columns(model, skipped: tuple = ()) -> list:
+    """Columns for a Core select whose rows stand in for model instances
+
+    Reads skip the ORM entirely: no identity map, no change tracking, no
+    instance state. Result rows are namedtuple-like with one attribute per
+    column, so the models' to_dict() can be called unbound on them
+    (BattleLog.to_dict(row)). Skipped columns come back as NULL.
+    """
+    return [
+        null().label(column.key) if column.key in skipped else getattr(model, column.key)
+        for column in model.__table__.columns
+    ]
+
+
+def _filtered(parse_class: ParseClass, query: Select, shape: tuple) -> Select:
+    if parse_class.base_criteria is not None:
+        query = query.where(parse_class.base_criteria())
+    if shape[1]:
+        query = query.where(_criteria(parse_class, shape))
+    return query
+
+
+@lru_cache(maxsize=512)
+def _cached_select(
+    class_name: str,
+    shape: tuple,
+    order: tuple,
+    cursor_nulls: Optional[tuple],
+    skipped_columns: tuple
+) -> Select:
+    parse_class = PARSE_CLASSES[class_name]
+    model = parse_class.model
+
+    query = _filtered(parse_class, select(*row_columns(model, skipped_columns)), shape)
+    if cursor_nulls is not None:
+        query = query.where(_keyset_criteria(parse_class, order, cursor_nulls))
+    for key, descending in order:
+        column = parse_class.fields[key].columns[0]
+        query = query.order_by(desc(column) if descending else asc(column))
+
+    return query.offset(bindparam("_skip", type_=Integer)).limit(bindparam("_limit", type_=Integer))
+
+
+@lru_cache(maxsize=256)
+def _cached_count(class_name: str, shape: tuple) -> Select:
+    parse_class = PARSE_CLASSES[class_name]
+    return _filtered(parse_class, select(func.count()).select_from(parse_class.model), shape)
+
+
+def parse_where(where: Optional[str]) -> dict:
+    """Decode a where parameter; a malformed one is an invalid query"""
+    if not where:
+        return {}
+    try:
+        where_dict = json.loads(where)
+    except ValueError:
+        raise invalid_query("where must be valid JSON")
+    if not isinstance(where_dict, dict):
+        raise invalid_query("where must be a JSON object")
+    return where_dict
+
+
+def _embed(pointer: Any, embedded: dict) -> Any:
+    if isinstance(pointer, dict) and pointer.get("objectId") in embedded:
+        return embedded[pointer["objectId"]]
+    return pointer
+
+
+class FindOptions:
+    """Parse find options beyond where/order/limit/skip
+
+    cursor: opt into keyset pagination. Pass an empty value for the first
+    page, then the nextCursor of the previous response; skip is ignored.
+    count: also return the number of matches (SELECT COUNT(*)); with
+    limit=0 no rows are fetched at all.
+    keys: comma-separated projection; objectId, createdAt and updatedAt are
+    always returned.
+    include: comma-separated pointer keys to replace with the full objects.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        count: bool = False,
+        keys: Optional[str] = None,
+        include: Optional[str] = None
+    ):
+        self.cursor = cursor
+        self.count = count
+        self.keys = keys
+        self.include = include
+
+
+def get_find_options(
+    cursor: Optional[str] = Query(None),
+    count: Optional[int] = Query(None),
+    keys: Optional[str] = Query(None),
+    include: Optional[str] = Query(None)
+) -> FindOptions:
+    return FindOptions(cursor=cursor, count=bool(count), keys=keys, include=include)
+
+
+class ParseQuery:
+    """A compiled Parse find: the Select, its bound values and paging state"""
+
+    def __init__(
+        self,
+        parse_class: ParseClass,
+        shape: tuple,
+        statement: Select,
+        params: dict,
+        order: tuple,
+        cursor_mode: bool,
+        keys: Optional[frozenset],
+        include: tuple = ()
+    ):
+        self.parse_class = parse_class
+        self.shape = shape
+        self.statement = statement
+        self.params = params
+        self.order = order
+        self.cursor_mode = cursor_mode
+        self.keys = keys
+        self.include = include
+
+    @property
+    def limit(self) -> int:
+        return self.params["_limit"]
+
+    async def fetch(self, db) -> list:
+        """Matching rows (see row_columns), not ORM instances"""
+        if self.limit == 0:
+            return []
+        result = await db.execute(self.statement, self.params)
+        return result.all()
+
+    async def count(self, db) -> int:
+        statement = _cached_count(self.parse_class.name, self.shape)
+        params = {key: value for key, value in self.params.items() if key.startswith("p")}
+        return (await db.execute(statement, params)).scalar_one()
+
+    def serialize(self, objects: list) -> list[dict]:
+        return [self.project(self.parse_class.serializer(obj)) for obj in objects]
+
+    async def resolve_includes(self, db, objects: list, responses: list[dict]):
+        """Embed included pointers, with one IN (...) query per target class"""
+        keys_by_target: dict[str, list[ParseField]] = {}
+        for key in self.include:
+            field = self.parse_class.fields[key]
+            keys_by_target.setdefault(field.target, []).append(field)
+
+        for target, fields in keys_by_target.items():
+            target_class = PARSE_CLASSES[target]
+            ids = {
+                getattr(obj, column.key)
+                for obj in objects for field in fields for column in field.columns
+            }
+            ids.discard(None)
+            if not ids:
+                continue
+
+            model = target_class.model
+            result = await db.execute(select(*row_columns(model)).where(model.objectId.in_(ids)))
+            embedded = {
+                row.objectId: {"__type": "Object", "className": target, **target_class.serializer(row)}
+                for row in result
+            }
+
+            for response in responses:
+                for field in fields:
+                    value = response.get(field.name)
+                    if isinstance(value, list):
+                        response[field.name] = [_embed(item, embedded) for item in value]
+                    elif value is not None:
+                        response[field.name] = _embed(value, embedded)
+
+    def project(self, response: dict) -> dict:
+        """Trim a serialized object to the requested keys"""
+        if self.keys is None:
+            return response
+        return {
+            key: value for key, value in response.items()
+            if key in self.keys or key in self.include or key in ("objectId", "createdAt", "updatedAt")
+        }
+
+    def next_cursor(self, objects: list) -> Optional[str]:
+        """Continuation token after the last object of a full page, else None"""
+        return self._cursor_after(objects[-1] if objects else None, len(objects))
+
+    def _cursor_after(self, last: Any, fetched: int) -> Optional[str]:
+        if not self.cursor_mode or last is None or fetched < self.limit:
+            return None
+        values = [getattr(last, self.parse_class.fields[key].columns[0].key) for key, _ in self.order]
+        return _encode_cursor(self.order, values)
+
+    @property
+    def streamed(self) -> bool:
+        """Large pages are rendered chunk by chunk instead of in one piece"""
+        return self.limit > settings.QUERY_STREAM_MIN_LIMIT
+
+    async def stream(self, bind, with_count: bool = False):
+        """The response body as JSON chunks read from a server-side cursor
+
+        At most QUERY_STREAM_CHUNK_SIZE rows (and their serialized dicts)
+        are held at a time. The rows are read in a session of their own on
+        the same engine, since the request's session is closed before the
+        response body is iterated.
+        """
+        yield b'{"results":['
+        last, fetched = None, 0
+        async with AsyncSession(bind) as db:
+            result = await db.stream(self.statement, self.params)
+            async for rows in result.partitions(settings.QUERY_STREAM_CHUNK_SIZE):
+                responses = self.serialize(rows)
+                if self.include:
+                    await self.resolve_includes(db, rows, responses)
+                chunk = dumps(responses)[1:-1]
+                yield chunk if not fetched else b"," + chunk
+                last, fetched = rows[-1], fetched + len(rows)
+
+            tail = {}
+            if with_count:
+                tail["count"] = await self.count(db)
+            if self.cursor_mode:
+                tail["nextCursor"] = self._cursor_after(last, fetched)
+        yield b"]" + (b"," + dumps(tail)[1:] if tail else b"}")
+
+
+def compile_query(
+    class_name: str,
+    where: Optional[str],
+    order: Optional[str],
+    limit: int,
+    skip: int,
+    cursor: Optional[str] = None,
+    keys: Optional[str] = None,
+    include: Optional[str] = None
+) -> ParseQuery:
+    """Compile a Parse find into a (cached) Select and its bound values
+
+    Raises HTTPException 400 with code 102 for invalid where clauses or
+    cursors and 105 for sort keys outside the class's indexed whitelist.
+    limit is capped at QUERY_MAX_LIMIT; a negative limit or skip is an
+    invalid query (SQLite would read LIMIT -1 as no limit at all).
+    """
+    if (limit is not None and limit < 0) or (skip is not None and skip < 0):
+        raise invalid_query("limit and skip must not be negative")
+    parse_class = PARSE_CLASSES[class_name]
+    params = {}
+    shape = _where_shape(parse_class, parse_where(where), params)
+    order_keys = parse_class.parse_order(order)
+    selected_keys = parse_class.parse_keys(keys)
+    include_keys = parse_class.parse_include(include)
+    skipped_columns = parse_class.hidden
+    if selected_keys is not None:
+        for key in parse_class.heavy:
+            if key not in selected_keys:
+                skipped_columns += (key,) + parse_class.storage.get(key, ())
+
+    cursor_mode = cursor is not None
+    cursor_nulls = None
+    if cursor_mode:
+        # objectId breaks ties so every row has a unique position
+        if not any(key == "objectId" for key, _ in order_keys):
+            order_keys += (("objectId", False),)
+        if cursor:
+            values = _decode_cursor(parse_class, order_keys, cursor)
+            cursor_nulls = tuple(value is None for value in values)
+            for index, value in enumerate(values):
+                if value is not None:
+                    params[f"c{index}"] = value
+        skip = 0
+
+    statement = _cached_select(class_name, shape, order_keys, cursor_nulls, skipped_columns)
+    params["_skip"] = skip or 0
+    params["_limit"] = min(100 if limit is None else limit, settings.QUERY_MAX_LIMIT)
+    return ParseQuery(parse_class, shape, statement, params, order_keys, cursor_mode, selected_keys, include_keys)
+
+
+async def find_all(db, class_name: str, where: Optional[str] = None, order: Optional[str] = None, page_size: int = 500):
+    """Iterate over every match in keyset pages of page_size rows"""
+    cursor = ""
+    while cursor is not None:
+        query = compile_query(class_name, where, order, page_size, 0, cursor)
+        objects = await query.fetch(db)
+        for obj in objects:
+            yield obj
+        cursor = query.next_cursor(objects)
+
+
+def statement_cache_stats() -> dict:
+    info = _cached_select.cache_info()
+    count_info = _cached_count.cache_info()
+    return {
+        "size": info.currsize + count_info.currsize,
+        "hits": info.hits + count_info.hits,
+        "misses": info.misses + count_info.misses,
+    }
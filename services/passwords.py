@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import hashlib
+import hmac
+
+from passlib.hash import bcrypt
+
+from config import settings
+
+
+class PasswordHasher:
+    """One password hash scheme; subclasses are registered by scheme name"""
+    scheme: str = ""
+
+    def identify(self, hashed: str) -> bool:
+        raise NotImplementedError
+
+    def hash(self, password: str) -> str:
+        raise NotImplementedError
+
+    def verify(self, password: str, hashed: str) -> bool:
+        raise NotImplementedError
+
+    def needs_update(self, hashed: str) -> bool:
+        """True if the hash uses weaker parameters than currently configured"""
+        return False
+
+
+class Sha256Hasher(PasswordHasher):
+    """Legacy unsalted SHA-256 hex digests (verify-only in practice)"""
+    scheme = "sha256"
+
+    def identify(self, hashed: str) -> bool:
+        if len(hashed) != 64:
+            return False
+        try:
+            int(hashed, 16)
+        except ValueError:
+            return False
+        return True
+
+    def hash(self, password: str) -> str:
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return hmac.compare_digest(self.hash(password), hashed)
+
+
+class BcryptHasher(PasswordHasher):
+    scheme = "bcrypt"
+
+    def __init__(self, rounds: int):
+        self.rounds = rounds
+        self._hasher = bcrypt.using(rounds=rounds)
+
+    def identify(self, hashed: str) -> bool:
+        return hashed.startswith(("$2a$", "$2b$", "$2y$"))
+
+    def hash(self, password: str) -> str:
+        return self._hasher.hash(password)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return bcrypt.verify(password, hashed)
+
+    def needs_update(self, hashed: str) -> bool:
+        return self._hasher.needs_update(hashed)
+
+
+HASHERS: dict[str, PasswordHasher] = {}
+
+
+def register_hasher(hasher: PasswordHasher):
+    HASHERS[hasher.scheme] = hasher
+
+
+register_hasher(Sha256Hasher())
+register_hasher(BcryptHasher(settings.BCRYPT_ROUNDS))
+
+
+def identify_hasher(hashed: str) -> Optional[PasswordHasher]:
+    for hasher in HASHERS.values():
+        if hasher.identify(hashed):
+            return hasher
+    return None
+
+
+def hash_password_sync(password: str) -> str:
+    """Hash with the configured scheme (blocking; use hash_password in handlers)"""
+    return HASHERS[settings.PASSWORD_HASH_SCHEME].hash(password)
+
+
+def verify_password_sync(password: str, hashed: str) -> tuple[bool, Optional[str]]:
+    """Verify a password (blocking; use verify_password in handlers)
+
+    Returns (matches, new_hash). new_hash is set when the password matched
+    but the stored hash uses a legacy scheme or outdated parameters.
+    """
+    if not hashed:
+        return False, None
+    hasher = identify_hasher(hashed)
+    if not hasher or not hasher.verify(password, hashed):
+        return False, None
+
+    default = HASHERS[settings.PASSWORD_HASH_SCHEME]
+    if hasher is not default or hasher.needs_update(hashed):
+        return True, default.hash(password)
+    return True, None
+
+
+# Hashing runs on a small dedicated pool, and the semaphore keeps a login
+# storm from queueing unbounded work in front of it
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+_semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_CONCURRENCY)
+
+
+async def _run_in_pool(func, *args):
+    async with _semaphore:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run_in_pool(hash_password_sync, password)
+
+
+async def verify_password(password: str, hashed: str) -> tuple[bool, Optional[str]]:
+    return await _run_in_pool(verify_password_sync, password, hashed)
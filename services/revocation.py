@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from models.user import SessionRevocation
+from config import settings
+
+
+def _as_timestamp(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class RevocationList:
+    """In-memory mirror of the session_revocations table
+
+    Signed session tokens are checked against this list only, so validating
+    them never touches the database. Every revocation is written through to
+    the table and the list is reloaded from it on startup.
+
+    Other server processes only see a revocation when they reload the list,
+    which the session sweeper does every SESSION_SWEEP_INTERVAL_SECONDS; until
+    then a logged-out token is still accepted there. Run a single process or
+    shorten that interval if logouts must take effect everywhere at once.
+    """
+
+    def __init__(self):
+        # jti -> token expiry (unix seconds)
+        self._tokens: dict[str, float] = {}
+        # userId -> tokens issued before this time are revoked (unix seconds)
+        self._users: dict[str, float] = {}
+
+    def is_revoked(self, jti: Optional[str], user_id: str, issued_at: float) -> bool:
+        if jti is not None and jti in self._tokens:
+            return True
+        revoked_before = self._users.get(user_id)
+        return revoked_before is not None and issued_at < revoked_before
+
+    async def load(self, db: AsyncSession):
+        """Replace the in-memory list with the live rows from the database"""
+        now = datetime.now(timezone.utc)
+        result = await db.execute(
+            select(SessionRevocation).where(SessionRevocation.expiresAt > now)
+        )
+        tokens: dict[str, float] = {}
+        users: dict[str, float] = {}
+        for row in result.scalars():
+            if row.jti:
+                tokens[row.jti] = _as_timestamp(row.expiresAt)
+            elif row.userId:
+                revoked_at = _as_timestamp(row.revokedAt)
+                users[row.userId] = max(users.get(row.userId, 0.0), revoked_at)
+        self._tokens = tokens
+        self._users = users
+
+    async def revoke_token(self, db: AsyncSession, jti: str, user_id: str, expires_at: datetime):
+        """Revoke a single signed token (logout)"""
+        db.add(SessionRevocation(jti=jti, userId=user_id, expiresAt=expires_at))
+        await db.commit()
+        self._tokens[jti] = _as_timestamp(expires_at)
+
+    async def revoke_user(self, db: AsyncSession, user_id: str):
+        """Revoke every signed token issued to a user so far (clearSessionToken)"""
+        now = datetime.now(timezone.utc)
+        db.add(SessionRevocation(
+            userId=user_id,
+            revokedAt=now,
+            expiresAt=now + timedelta(days=settings.ACCESS_TOKEN_EXPIRE_DAYS)
+        ))
+        await db.commit()
+        self._users[user_id] = max(self._users.get(user_id, 0.0), now.timestamp())
+
+    def stats(self) -> dict:
+        return {"tokens": len(self._tokens), "users": len(self._users)}
+
+
+revocation_list = RevocationList()
@@ -0,0 +1,278 @@
+"""
+GameData save history for rolling back corrupted cloud saves.
+
+Every written save appends one GameDataHistory row. A row is a delta (the
+top-level keys set or removed since the previous version) when the
+previous version is still in the in-memory base cache, so the hot save path
+never reads history back; otherwise, every GAME_DATA_HISTORY_SNAPSHOT_EVERY
+versions, or when the save is not a JSON object, it is a full snapshot.
+The compactor trims each save to its newest GAME_DATA_HISTORY_MAX_VERSIONS
+versions, turning the oldest one kept into a snapshot first.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+import asyncio
+import json
+import logging
+import zlib
+
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session, after_commit
+from models.game_data import parse_save_object
+from models.game_data_history import GameDataHistory
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+def _encode(text: Optional[str]) -> Optional[bytes]:
+    return None if text is None else zlib.compress(text.encode("utf-8"))
+
+
+def _decode(payload: Optional[bytes]) -> Optional[str]:
+    return None if payload is None else zlib.decompress(payload).decode("utf-8")
+
+
+def diff_saves(before: dict, after: dict) -> dict:
+    """Top-level keys that changed from before to after"""
+    return {
+        "set": {key: value for key, value in after.items() if key not in before or before[key] != value},
+        "del": [key for key in before if key not in after],
+    }
+
+
+def apply_delta(state: dict, delta: dict) -> dict:
+    state = dict(state)
+    state.update(delta["set"])
+    for key in delta["del"]:
+        state.pop(key, None)
+    return state
+
+
+@dataclass
+class _Base:
+    version: int
+    since_snapshot: int
+    state: Optional[dict]
+
+
+class SaveHistory:
+    """Appends GameDataHistory rows and rebuilds past versions from them"""
+
+    def __init__(self, snapshot_every: int, max_versions: int, cache_size: int):
+        self.snapshot_every = snapshot_every
+        self.max_versions = max_versions
+        self.cache_size = cache_size
+        self._bases: OrderedDict[str, _Base] = OrderedDict()
+        self.snapshots = 0
+        self.deltas = 0
+        self.compacted_rows = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.GAME_DATA_HISTORY_ENABLED
+
+    def entry(
+        self,
+        db: AsyncSession,
+        game_data_id: str,
+        user_id: str,
+        version: int,
+        text: Optional[str],
+        state: Optional[dict] = None
+    ) -> dict:
+        """Values of the history row for `text` as version `version`
+
+        The row must be written in db's transaction: the base cache and the
+        counters are updated when it commits. `state` is the save already
+        parsed by parse_save_object, if any.
+        """
+        if state is None:
+            state = parse_save_object(text)
+        base = self._bases.get(game_data_id)
+        diffable = (
+            base is not None
+            and base.version == version - 1
+            and base.since_snapshot + 1 < self.snapshot_every
+            and base.state is not None
+            and state is not None
+        )
+        kind, payload = SNAPSHOT, _encode(text)
+        if diffable:
+            delta = _encode(json.dumps(diff_saves(base.state, state)))
+            # A delta that is not smaller than the save buys nothing
+            if payload is None or len(delta) < len(payload):
+                kind, payload = DELTA, delta
+
+        since_snapshot = base.since_snapshot + 1 if kind == DELTA else 0
+        after_commit(db, lambda: self._remember(game_data_id, kind, _Base(version, since_snapshot, state)))
+
+        return {
+            "gameDataId": game_data_id,
+            "userId": user_id,
+            "version": version,
+            "kind": kind,
+            "payload": payload,
+        }
+
+    def _remember(self, game_data_id: str, kind: str, base: _Base):
+        if kind == DELTA:
+            self.deltas += 1
+        else:
+            self.snapshots += 1
+        self._bases[game_data_id] = base
+        self._bases.move_to_end(game_data_id)
+        while len(self._bases) > self.cache_size:
+            self._bases.popitem(last=False)
+
+    async def append(
+        self,
+        db: AsyncSession,
+        game_data_id: str,
+        user_id: str,
+        version: int,
+        text: Optional[str],
+        state: Optional[dict] = None
+    ):
+        """Insert the history row of one written save (in the caller's transaction)"""
+        entry = self.entry(db, game_data_id, user_id, version, text, state)
+        await db.execute(insert(GameDataHistory).values(**entry))
+
+    async def append_instance(self, db: AsyncSession, game_data, text: Optional[str]):
+        """Bump a loaded GameData's historyVersion and append its history row"""
+        game_data.historyVersion = (game_data.historyVersion or 0) + 1
+        await db.flush()
+        await self.append(db, game_data.objectId, game_data.userId, game_data.historyVersion, text)
+
+    @staticmethod
+    async def versions(db: AsyncSession, game_data_id: str, up_to: Optional[int] = None) -> list:
+        """History rows of one save from its latest snapshot at or before up_to"""
+        criteria = [GameDataHistory.gameDataId == game_data_id]
+        if up_to is not None:
+            criteria.append(GameDataHistory.version <= up_to)
+        start = (
+            select(func.max(GameDataHistory.version))
+            .where(*criteria, GameDataHistory.kind == SNAPSHOT)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            select(GameDataHistory.version, GameDataHistory.kind, GameDataHistory.payload)
+            .where(*criteria, GameDataHistory.version >= start)
+            .order_by(GameDataHistory.version)
+        )
+        return result.all()
+
+    @classmethod
+    async def materialize(cls, db: AsyncSession, game_data_id: str, version: int) -> Optional[str]:
+        """The save text of one version; raises KeyError if it is not kept"""
+        rows = await cls.versions(db, game_data_id, version)
+        if not rows or rows[-1].version != version:
+            raise KeyError(f"Version {version} of GameData {game_data_id} is not in the history")
+
+        text = _decode(rows[0].payload)
+        if len(rows) == 1:
+            # Snapshots keep the client's exact bytes
+            return text
+        state = parse_save_object(text)
+        for row in rows[1:]:
+            state = apply_delta(state, json.loads(_decode(row.payload)))
+        return json.dumps(state, ensure_ascii=False)
+
+    async def compact(self, batch_size: int = 100) -> int:
+        """Trim saves with more than max_versions versions; returns rows deleted
+
+        Saves are picked batch_size at a time until none is over the limit,
+        so one run catches up with however many saves grew since the last.
+        """
+        deleted = 0
+        while True:
+            async with async_session() as db:
+                result = await db.execute(
+                    select(GameDataHistory.gameDataId)
+                    .group_by(GameDataHistory.gameDataId)
+                    .having(func.count() > self.max_versions)
+                    .limit(batch_size)
+                )
+                game_data_ids = list(result.scalars())
+            if not game_data_ids:
+                break
+
+            batch_deleted = 0
+            for game_data_id in game_data_ids:
+                batch_deleted += await self._trim(game_data_id)
+            deleted += batch_deleted
+            if not batch_deleted:
+                # Nothing trimmable after all; do not pick the same saves forever
+                break
+            # Let request handlers get at the database between batches
+            await asyncio.sleep(0)
+
+        self.compacted_rows += deleted
+        return deleted
+
+    async def _trim(self, game_data_id: str) -> int:
+        """Delete the versions of one save older than its newest max_versions"""
+        async with async_session() as db:
+            result = await db.execute(
+                select(GameDataHistory.version)
+                .where(GameDataHistory.gameDataId == game_data_id)
+                .order_by(GameDataHistory.version.desc())
+                .offset(self.max_versions - 1)
+                .limit(1)
+            )
+            oldest_kept = result.scalar_one_or_none()
+            if oldest_kept is None:
+                return 0
+
+            rows = await self.versions(db, game_data_id, oldest_kept)
+            if rows[-1].kind != SNAPSHOT:
+                text = await self.materialize(db, game_data_id, oldest_kept)
+                await db.execute(
+                    update(GameDataHistory)
+                    .where(GameDataHistory.gameDataId == game_data_id, GameDataHistory.version == oldest_kept)
+                    .values(kind=SNAPSHOT, payload=_encode(text))
+                )
+            result = await db.execute(
+                delete(GameDataHistory)
+                .where(GameDataHistory.gameDataId == game_data_id, GameDataHistory.version < oldest_kept)
+            )
+            await db.commit()
+            return result.rowcount
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "snapshots": self.snapshots,
+            "deltas": self.deltas,
+            "cachedBases": len(self._bases),
+            "compactedRows": self.compacted_rows,
+        }
+
+
+save_history = SaveHistory(
+    settings.GAME_DATA_HISTORY_SNAPSHOT_EVERY,
+    settings.GAME_DATA_HISTORY_MAX_VERSIONS,
+    settings.GAME_DATA_HISTORY_CACHE_SIZE,
+)
+
+
+async def run_history_compactor(interval_seconds: int):
+    """Periodically compact save history until cancelled"""
+    while True:
+        try:
+            deleted = await save_history.compact()
+            if deleted:
+                logger.info(f"History compactor removed {deleted} old save versions")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"History compactor failed: {type(e).__name__}: {e}")
+        await asyncio.sleep(interval_seconds)
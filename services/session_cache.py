@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+import time
+
+from config import settings
+
+
+class SessionCache:
+    """Bounded TTL/LRU cache mapping session token -> (userId, expiresAt)
+
+    Only the resolved identity is cached, never ORM objects, so entries are
+    safe to share between requests and DB sessions.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[str, Optional[datetime], float]]" = OrderedDict()
+        self._tokens_by_user: dict[str, set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, session_token: str) -> Optional[tuple[str, Optional[datetime]]]:
+        """Return (userId, expiresAt) for a cached token, or None on miss"""
+        entry = self._entries.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        user_id, expires_at, cached_at = entry
+        now = time.monotonic()
+        if now - cached_at > self.ttl_seconds or (
+            expires_at is not None and expires_at < datetime.now(timezone.utc)
+        ):
+            self._remove(session_token)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(session_token)
+        self.hits += 1
+        return user_id, expires_at
+
+    def put(self, session_token: str, user_id: str, expires_at: Optional[datetime]):
+        if not self.enabled:
+            return
+        if expires_at is not None and expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+
+        self._remove(session_token)
+        self._entries[session_token] = (user_id, expires_at, time.monotonic())
+        self._tokens_by_user.setdefault(user_id, set()).add(session_token)
+
+        while len(self._entries) > self.max_size:
+            oldest_token = next(iter(self._entries))
+            self._remove(oldest_token)
+
+    def invalidate_token(self, session_token: str):
+        self._remove(session_token)
+
+    def invalidate_user(self, user_id: str):
+        for session_token in list(self._tokens_by_user.get(user_id, ())):
+            self._remove(session_token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "ttlSeconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _remove(self, session_token: str):
+        entry = self._entries.pop(session_token, None)
+        if entry is None:
+            return
+        user_tokens = self._tokens_by_user.get(entry[0])
+        if user_tokens is not None:
+            user_tokens.discard(session_token)
+            if not user_tokens:
+                del self._tokens_by_user[entry[0]]
+
+
+session_cache = SessionCache(
+    max_size=settings.SESSION_CACHE_SIZE,
+    ttl_seconds=settings.SESSION_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+import asyncio
+import logging
+
+from sqlalchemy import select, delete
+
+from database import async_session
+from models.user import Session, SessionRevocation
+from services.revocation import revocation_list
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _delete_expired_batch(db, model, batch_size: int) -> int:
+    now = datetime.now(timezone.utc)
+    expired_ids = (
+        select(model.id)
+        .where(model.expiresAt < now)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    result = await db.execute(delete(model).where(model.id.in_(expired_ids)))
+    await db.commit()
+    return result.rowcount or 0
+
+
+async def sweep_expired_sessions(batch_size: int = None) -> int:
+    """Delete expired sessions and revocations in small batches
+
+    Each batch is its own short transaction (served by the expiresAt
+    indexes), so the sweep never holds the write lock for long.
+    """
+    batch_size = batch_size or settings.SESSION_SWEEP_BATCH_SIZE
+    total = 0
+    async with async_session() as db:
+        for model in (Session, SessionRevocation):
+            while True:
+                deleted = await _delete_expired_batch(db, model, batch_size)
+                total += deleted
+                if deleted < batch_size:
+                    break
+                # Let request handlers get at the database between batches
+                await asyncio.sleep(0)
+
+        # Pick up revocations written by other server processes
+        await revocation_list.load(db)
+    return total
+
+
+async def run_session_sweeper(interval_seconds: int):
+    """Periodically sweep expired sessions until cancelled"""
+    while True:
+        try:
+            deleted = await sweep_expired_sessions()
+            if deleted:
+                logger.info(f"Session sweeper removed {deleted} expired rows")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Session sweeper failed: {type(e).__name__}: {e}")
+        await asyncio.sleep(interval_seconds)
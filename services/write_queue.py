@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session, read_router
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+WriteOperation = Callable[[AsyncSession], Awaitable[Any]]
+
+
+@dataclass
+class _PendingWrite:
+    operation: WriteOperation
+    future: asyncio.Future
+    session_token: Optional[str] = None
+
+
+class WriteQueue:
+    """Single writer task that group-commits mutations from many requests
+
+    Handlers submit an operation (an async callable taking a session). The
+    writer collects operations for up to WRITE_QUEUE_MAX_DELAY_MS or
+    WRITE_QUEUE_MAX_BATCH items, runs them in one transaction, commits once
+    and resolves each caller's future with its operation's return value.
+
+    Each operation runs in its own savepoint: if it raises, only its
+    savepoint is rolled back and that caller gets the exception. If the
+    commit itself fails, the group's operations are re-run one transaction
+    each, so operations must only touch the database through the session
+    they get, and register any in-memory side effects with
+    database.after_commit() instead of applying them directly.
+    """
+
+    def __init__(self, max_batch: int, max_delay_ms: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.operations = 0
+        self.commits = 0
+        self.failed = 0
+        self.retried_groups = 0
+        self.largest_group = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._writer())
+
+    async def stop(self):
+        """Finish every queued write, then stop the writer"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def submit(self, operation: WriteOperation, session_token: Optional[str] = None) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingWrite(operation, future, session_token))
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "operations": self.operations,
+            "commits": self.commits,
+            "failed": self.failed,
+            "retriedGroups": self.retried_groups,
+            "largestGroup": self.largest_group,
+            "avgGroupSize": round(self.operations / self.commits, 2) if self.commits else 0.0,
+        }
+
+    async def _collect_group(self) -> list[_PendingWrite]:
+        group = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_delay
+        while len(group) < self.max_batch:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                group.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return group
+
+    async def _writer(self):
+        while True:
+            group = await self._collect_group()
+            try:
+                await self._commit_group(group)
+            except Exception as e:
+                logger.error(f"Write queue group failed: {type(e).__name__}: {e}")
+                for item in group:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+            finally:
+                for _ in group:
+                    self._queue.task_done()
+
+    def _fail(self, item: _PendingWrite, error: Exception):
+        self.failed += 1
+        if not item.future.done():
+            item.future.set_exception(error)
+
+    async def _commit_group(self, group: list[_PendingWrite]):
+        pending = [item for item in group if not item.future.cancelled()]
+        if not pending:
+            return
+        done = []
+        try:
+            async with async_session() as db:
+                for item in pending:
+                    callbacks = db.info.setdefault("after_commit", [])
+                    registered = len(callbacks)
+                    try:
+                        async with db.begin_nested():
+                            result = await item.operation(db)
+                    except Exception as e:
+                        # Its savepoint is gone, and so are its after_commit() callbacks
+                        del callbacks[registered:]
+                        self._fail(item, e)
+                    else:
+                        done.append((item, result))
+                if not done:
+                    return
+                await db.commit()
+        except Exception as e:
+            if len(done) > 1:
+                # The commit itself failed: find the culprit one operation at a time
+                self.retried_groups += 1
+                for item, _ in done:
+                    await self._commit_group([item])
+                return
+            for item in pending:
+                if not item.future.done():
+                    self._fail(item, e)
+            return
+
+        self.commits += 1
+        self.operations += len(done)
+        self.largest_group = max(self.largest_group, len(done))
+        for item, result in done:
+            if item.session_token:
+                read_router.record_write(item.session_token)
+            if not item.future.done():
+                item.future.set_result(result)
+
+
+write_queue = WriteQueue(settings.WRITE_QUEUE_MAX_BATCH, settings.WRITE_QUEUE_MAX_DELAY_MS)
+
+
+async def run_write(db: AsyncSession, operation: WriteOperation) -> Any:
+    """Run operation(session) and commit it, through the writer queue when enabled"""
+    if write_queue.running:
+        return await write_queue.submit(operation, db.info.get("session_token"))
+    result = await operation(db)
+    await db.commit()
+    return result
@@ -0,0 +1,58 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+# Settings are read when config is first imported, so point them at a
+# throwaway database before anything imports the app. TEST_DATABASE_URL runs
+# the suite against another (empty, disposable) database such as PostgreSQL
+_data_dir = tempfile.mkdtemp(prefix="aom-test-")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or f"sqlite+aiosqlite:///{_data_dir}/test.db"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["SESSION_SWEEP_INTERVAL_SECONDS"] = "0"
+os.environ["GAME_DATA_HISTORY_COMPACT_INTERVAL_SECONDS"] = "0"
+# Tests that need the write queue or the write-behind buffer start their own
+os.environ["WRITE_QUEUE_ENABLED"] = "false"
+os.environ["GAME_DATA_WRITE_BEHIND"] = "false"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+    shutil.rmtree(_data_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def sign_up(client):
+    """Sign up a new user and return its objectId and X-Parse-Session-Token header"""
+    def sign_up() -> tuple[str, dict]:
+        response = client.post("/parse/users", json={"username": f"user-{uuid.uuid4().hex}", "password": "secret"})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        return body["objectId"], {"X-Parse-Session-Token": body["sessionToken"]}
+    return sign_up
+
+
+@pytest.fixture
+def make_user(sign_up):
+    """Sign up a new user and return its objectId"""
+    def make_user() -> str:
+        return sign_up()[0]
+    return make_user
+
+
+def pointer(object_id: str) -> dict:
+    return {"__type": "Pointer", "className": "_User", "objectId": object_id}
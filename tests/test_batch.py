@@ -0,0 +1,33 @@
+from conftest import pointer
+
+
+def test_create_with_missing_pointer_is_a_parse_error(client, make_user):
+    sender = make_user()
+
+    response = client.post("/parse/classes/BattleLog", json={"sender": pointer(sender), "receiver": pointer("ghost")})
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == 111
+
+    response = client.post("/parse/classes/GameData", json={"user": pointer("ghost"), "data": "{}"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == 111
+
+
+def test_batch_item_failure_stays_per_item(client, make_user):
+    sender, receiver = make_user(), make_user()
+    create = {"method": "POST", "path": "/parse/classes/BattleLog"}
+
+    response = client.post("/parse/batch", json={"requests": [
+        {**create, "body": {"sender": pointer(sender), "receiver": pointer(receiver)}},
+        {**create, "body": {"sender": pointer(sender), "receiver": pointer("ghost")}},
+        {**create, "body": {"sender": pointer(sender), "receiver": pointer(receiver), "senderScore": 7}},
+    ]})
+    assert response.status_code == 200
+    first, failed, last = response.json()
+    assert failed == {"error": {"code": 111, "error": "Pointer to a missing object"}}
+
+    response = client.get("/parse/classes/BattleLog", params={
+        "where": f'{{"sender":"{sender}"}}', "order": "createdAt"
+    })
+    results = response.json()["results"]
+    assert [log["objectId"] for log in results] == [first["success"]["objectId"], last["success"]["objectId"]]
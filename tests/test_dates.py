@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models.user import format_parse_date
+from services.parse_query import parse_date
+
+
+NOW = datetime(2024, 5, 17, 8, 30, 12, 345678, tzinfo=timezone.utc)
+
+
+def round_trip(dt: datetime) -> datetime:
+    return parse_date({"__type": "Date", "iso": format_parse_date(dt)})
+
+
+@pytest.mark.parametrize("dt", [
+    NOW,
+    # SQLite hands back naive UTC values
+    NOW.replace(tzinfo=None),
+    NOW.astimezone(timezone(timedelta(hours=8))),
+    NOW.astimezone(timezone(timedelta(hours=-5, minutes=-30))),
+    NOW.replace(microsecond=0),
+    NOW.replace(microsecond=999999),
+])
+def test_round_trip(dt):
+    parsed = round_trip(dt)
+    expected = dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    # Parse dates carry milliseconds; the microseconds are truncated
+    assert parsed == expected.replace(microsecond=expected.microsecond // 1000 * 1000)
+    assert format_parse_date(parsed) == format_parse_date(dt)
+
+
+def test_format():
+    assert format_parse_date(NOW) == "2024-05-17T08:30:12.345Z"
+    assert format_parse_date(NOW.replace(tzinfo=None)) == "2024-05-17T08:30:12.345Z"
+    assert format_parse_date(NOW.astimezone(timezone(timedelta(hours=8)))) == "2024-05-17T08:30:12.345Z"
+    assert format_parse_date(NOW.replace(microsecond=0)) == "2024-05-17T08:30:12.000Z"
+    assert format_parse_date(None) is None
@@ -0,0 +1,33 @@
+from conftest import pointer
+
+
+def test_add_friend_twice_returns_the_same_relation(client, sign_up):
+    me, my_headers = sign_up()
+    friend, friend_headers = sign_up()
+
+    first = client.post("/parse/functions/addFriend", json={"targetUserID": friend}, headers=my_headers)
+    again = client.post("/parse/functions/addFriend", json={"targetUserID": friend}, headers=my_headers)
+    reverse = client.post("/parse/functions/addFriend", json={"targetUserID": me}, headers=friend_headers)
+
+    assert first.status_code == 200, first.text
+    object_id = first.json()["result"]["objectId"]
+    assert again.json()["result"]["objectId"] == object_id
+    assert reverse.json()["result"]["objectId"] == object_id
+    users = {user["objectId"] for user in first.json()["result"]["users"]}
+    assert users == {me, friend}
+
+
+def test_add_friend_with_missing_user(client, sign_up):
+    headers = sign_up()[1]
+    response = client.post("/parse/functions/addFriend", json={"targetUserID": "ghost"}, headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"]["code"] == 101
+
+
+def test_create_existing_friend_relation(client, make_user):
+    me, friend = make_user(), make_user()
+    first = client.post("/parse/classes/FriendRelation", json={"users": [pointer(me), pointer(friend)]})
+    reverse = client.post("/parse/classes/FriendRelation", json={"users": [pointer(friend), pointer(me)]})
+
+    assert first.status_code == 200, first.text
+    assert reverse.json()["objectId"] == first.json()["objectId"]
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from conftest import pointer
+from models.game_data import extract_progress, parse_save_object
+
+
+@pytest.mark.parametrize("save, expected", [
+    ({"golds": 12.5, "stage": 40, "wave": 3, "prestige": 2}, {"golds": 12.5, "stage": 40, "wave": 3, "prestige": 2}),
+    ({"golds": 10, "stage": 7.9}, {"golds": 10.0, "stage": 7, "wave": None, "prestige": None}),
+    ({"golds": "12", "stage": True, "wave": None}, {"golds": None, "stage": None, "wave": None, "prestige": None}),
+    # Out of range for the columns: stored as NULL
+    ({"golds": 10 ** 400, "stage": 1e20, "wave": 10 ** 19, "prestige": -(2 ** 31) - 1},
+     {"golds": None, "stage": None, "wave": None, "prestige": None}),
+    ({"golds": 1e300, "stage": 2 ** 31 - 1}, {"golds": 1e300, "stage": 2 ** 31 - 1, "wave": None, "prestige": None}),
+])
+def test_extract_progress(save, expected):
+    assert extract_progress(save) == expected
+
+
+def test_extract_progress_non_finite():
+    state = parse_save_object('{"golds": Infinity, "stage": NaN}')
+    assert extract_progress(state) == {"golds": None, "stage": None, "wave": None, "prestige": None}
+
+
+def test_out_of_range_progress_still_saves(client, make_user):
+    save = json.dumps({"golds": 1e300, "stage": 10 ** 19, "wave": 1e20})
+    response = client.post("/parse/classes/GameData", json={"user": pointer(make_user()), "data": save})
+    assert response.status_code == 200, response.text
+    object_id = response.json()["objectId"]
+
+    update = json.dumps({"golds": 10 ** 400, "stage": 1e20})
+    response = client.put(f"/parse/classes/GameData/{object_id}", json={"data": update})
+    assert response.status_code == 200, response.text
+
+    response = client.get("/parse/classes/GameData", params={"where": json.dumps({"objectId": object_id})})
+    assert response.json()["results"][0]["data"] == update
@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy import event
+
+from conftest import pointer
+from database import engine, async_session
+from models.game_data import GameData
+import services.game_data_buffer as buffer_module
+from services.game_data_buffer import GameDataBuffer
+
+
+@pytest.fixture
+def game_data_id(client, make_user):
+    response = client.post("/parse/classes/GameData", json={"user": pointer(make_user()), "data": '{"stage": 1}'})
+    return response.json()["objectId"]
+
+
+@pytest.fixture
+async def buffer(client):
+    buffer = GameDataBuffer(flush_interval_seconds=3600, max_pending=1000)
+    buffer.start()
+    yield buffer
+    await buffer.stop()
+
+
+async def stored_data(object_id: str) -> str:
+    async with async_session() as db:
+        game_data = await db.get(GameData, object_id)
+        return game_data.save_data()
+
+
+def overlaid_data(buffer: GameDataBuffer, object_id: str) -> str:
+    return buffer.overlay({"objectId": object_id, "data": None, "updatedAt": None})["data"]
+
+
+@pytest.mark.anyio
+async def test_saves_stay_visible_until_committed(buffer, game_data_id):
+    async with async_session() as db:
+        await buffer.save(db, game_data_id, '{"stage": 2}')
+
+    seen_during_flush = []
+
+    def during_flush(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE game_data"):
+            seen_during_flush.append(overlaid_data(buffer, game_data_id))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", during_flush)
+    try:
+        assert await buffer.flush() == 1
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", during_flush)
+
+    assert seen_during_flush == ['{"stage": 2}']
+    assert await stored_data(game_data_id) == '{"stage": 2}'
+    assert buffer.stats()["pending"] == 0
+
+
+@pytest.mark.anyio
+async def test_save_replaced_during_flush_stays_pending(buffer, game_data_id):
+    async with async_session() as db:
+        await buffer.save(db, game_data_id, '{"stage": 2}')
+
+    def newer_save(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE game_data"):
+            # What save() does for a request arriving while the flush is in flight
+            updated_at = buffer._pending[game_data_id].updated_at
+            buffer._pending[game_data_id] = buffer_module._PendingSave('{"stage": 3}', "newer", updated_at)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", newer_save)
+    try:
+        await buffer.flush()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", newer_save)
+
+    assert await stored_data(game_data_id) == '{"stage": 2}'
+    assert overlaid_data(buffer, game_data_id) == '{"stage": 3}'
+    assert await buffer.flush() == 1
+    assert await stored_data(game_data_id) == '{"stage": 3}'
+
+
+@pytest.mark.anyio
+async def test_failed_flush_keeps_saves(buffer, game_data_id, monkeypatch):
+    async with async_session() as db:
+        await buffer.save(db, game_data_id, '{"stage": 2}')
+
+    def unavailable():
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(buffer_module, "async_session", unavailable)
+    with pytest.raises(ConnectionError):
+        await buffer.flush()
+    assert overlaid_data(buffer, game_data_id) == '{"stage": 2}'
+
+    monkeypatch.undo()
+    assert await buffer.flush() == 1
+    assert await stored_data(game_data_id) == '{"stage": 2}'
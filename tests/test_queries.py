@@ -0,0 +1,110 @@
+"""The class queries documented in api.md, as the client sends them"""
+
+import base64
+import json
+
+import pytest
+
+from config import settings
+from conftest import pointer
+
+
+@pytest.fixture
+def friends(client, make_user):
+    """A user with two friends, their summaries, a save and battle logs"""
+    me, first, second = make_user(), make_user(), make_user()
+    for user in (me, first, second):
+        client.post("/parse/classes/UserSummary", json={"user": pointer(user), "displayName": user})
+    for friend in (first, second):
+        client.post("/parse/classes/FriendRelation", json={"users": [pointer(me), pointer(friend)]})
+        client.post("/parse/classes/BattleLog", json={"sender": pointer(me), "receiver": pointer(friend)})
+        client.post("/parse/classes/BattleLog", json={"sender": pointer(friend), "receiver": pointer(me)})
+    client.post("/parse/classes/GameData", json={"user": pointer(me), "data": "{}"})
+    return me, first, second
+
+
+# (class, where, extra params, expected result count)
+API_QUERIES = [
+    ("UserSummary", lambda me, a, b: {"user": pointer(me)}, {}, 1),
+    ("GameData", lambda me, a, b: {"user": pointer(me)}, {"order": "updatedAt", "limit": 1}, 1),
+    ("FriendRelation", lambda me, a, b: {"users": pointer(me)}, {"order": "createdAt"}, 2),
+    ("UserSummary", lambda me, a, b: {"user": {"$in": [pointer(a), pointer(b)]}}, {"order": "createdAt"}, 2),
+    ("BattleLog", lambda me, a, b: {"sender": pointer(me), "receiver": pointer(a)}, {"order": "-createdAt", "limit": 1}, 1),
+    ("BattleLog", lambda me, a, b: {"receiver": pointer(me), "receiverClaim": False}, {"order": "createdAt"}, 2),
+    ("DropBox", lambda me, a, b: {"user": pointer(me)}, {}, 0),
+]
+
+
+@pytest.mark.parametrize("method", ["GET", "POST"])
+@pytest.mark.parametrize("class_name, where, params, expected", API_QUERIES)
+def test_api_queries(client, friends, method, class_name, where, params, expected):
+    params = {"where": json.dumps(where(*friends)), **params}
+    response = client.request(method, f"/parse/classes/{class_name}", params=params)
+    assert response.status_code == 200, response.text
+    assert len(response.json()["results"]) == expected
+
+
+@pytest.mark.parametrize("order", ["bogus", "-senderScore,createdAt"])
+def test_sort_by_unknown_or_unindexed_key(client, order):
+    response = client.get("/parse/classes/BattleLog", params={"order": order})
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == 105
+
+
+def test_unknown_where_key_is_ignored(client, friends):
+    me = friends[0]
+    response = client.get("/parse/classes/UserSummary", params={
+        "where": json.dumps({"user": pointer(me), "bogus": 1})
+    })
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 1
+
+
+def test_unknown_where_key_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_IGNORE_UNKNOWN_KEYS", False)
+    response = client.get("/parse/classes/UserSummary", params={"where": json.dumps({"bogus": 1})})
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == 102
+
+
+@pytest.mark.parametrize("params", [{"limit": -1}, {"skip": -1}])
+def test_negative_limit_or_skip(client, params):
+    response = client.get("/parse/classes/UserSummary", params=params)
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == 102
+
+
+def test_limit_is_capped(client, friends, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_MAX_LIMIT", 2)
+    response = client.get("/parse/classes/UserSummary", params={"limit": 1000})
+    assert len(response.json()["results"]) == 2
+
+
+def encode_cursor(payload: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_cursor_pages(client, friends):
+    me = friends[0]
+    params = {"where": json.dumps({"sender": pointer(me)}), "order": "-createdAt", "limit": 1, "cursor": ""}
+    first = client.get("/parse/classes/BattleLog", params=params).json()
+    second = client.get("/parse/classes/BattleLog", params={**params, "cursor": first["nextCursor"]}).json()
+
+    assert len(first["results"]) == len(second["results"]) == 1
+    assert first["results"][0]["objectId"] != second["results"][0]["objectId"]
+
+
+@pytest.mark.parametrize("order, values", [
+    ("objectId", [{}]),
+    ("objectId", [["a"]]),
+    ("objectId", [1]),
+    ("-createdAt", [{"__type": "Date", "iso": "2024-01-01T00:00:00.000Z"}, "a"]),
+    ("-createdAt", ["not a date", "a"]),
+    ("-createdAt", [True, "a"]),
+])
+def test_crafted_cursor(client, order, values):
+    keys = order.split(",") + ([] if order == "objectId" else ["objectId"])
+    cursor = encode_cursor({"o": keys, "v": values})
+    response = client.get("/parse/classes/BattleLog", params={"order": order, "cursor": cursor})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == {"code": 102, "error": "Invalid cursor"}
@@ -0,0 +1,43 @@
+import database
+from conftest import pointer
+from database import ReadRouter, read_router
+
+
+def reads() -> int:
+    return read_router.primary_reads + read_router.replica_reads
+
+
+def test_only_queries_count_as_reads(client, make_user):
+    user = make_user()
+
+    before = reads()
+    response = client.post("/parse/classes/GameData", json={"user": pointer(user), "data": "{}"})
+    assert response.status_code == 200
+    assert reads() == before
+
+    response = client.post("/parse/classes/GameData", params={"where": f'{{"user":"{user}"}}'})
+    assert len(response.json()["results"]) == 1
+    assert reads() == before + 1
+
+    response = client.get("/parse/classes/GameData", params={"where": f'{{"user":"{user}"}}', "limit": 5000})
+    assert len(response.json()["results"]) == 1
+    assert reads() == before + 2
+
+
+def test_writers_expire_after_the_lag_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(database.time, "monotonic", lambda: now[0])
+    router = ReadRouter(max_lag_seconds=5)
+
+    router.record_write("r:first")
+    now[0] += 3
+    router.record_write("r:second")
+    router.record_write("r:first")
+    now[0] += 4
+    router.record_write("r:third")
+
+    # r:second wrote 4s ago, r:first 4s ago (its rewrite), r:third just now
+    assert list(router._last_write) == ["r:second", "r:first", "r:third"]
+    now[0] += 2
+    router.record_write("r:third")
+    assert list(router._last_write) == ["r:third"]
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+from sqlalchemy import select, func
+
+from conftest import pointer
+from database import async_session
+from models.game_data_history import GameDataHistory
+from services.save_history import SaveHistory
+
+
+@pytest.mark.anyio
+async def test_compact_trims_every_save(client, make_user):
+    history = SaveHistory(snapshot_every=4, max_versions=3, cache_size=100)
+    user = make_user()
+    game_data_ids = [
+        client.post("/parse/classes/GameData", json={"user": pointer(user), "data": "{}"}).json()["objectId"]
+        for _ in range(5)
+    ]
+    async with async_session() as db:
+        await db.execute(GameDataHistory.__table__.delete().where(GameDataHistory.gameDataId.in_(game_data_ids)))
+        for game_data_id in game_data_ids:
+            for version in range(1, 11):
+                await history.append(db, game_data_id, user, version, json.dumps({"stage": version}))
+        await db.commit()
+
+    # More saves over the limit than one batch holds
+    assert await history.compact(batch_size=2) == 5 * 7
+
+    async with async_session() as db:
+        result = await db.execute(
+            select(GameDataHistory.gameDataId, func.count(), func.min(GameDataHistory.version))
+            .where(GameDataHistory.gameDataId.in_(game_data_ids))
+            .group_by(GameDataHistory.gameDataId)
+        )
+        assert sorted(tuple(row)[1:] for row in result) == [(3, 8)] * 5
+        for game_data_id in game_data_ids:
+            assert json.loads(await history.materialize(db, game_data_id, 8)) == {"stage": 8}
+            assert json.loads(await history.materialize(db, game_data_id, 10)) == {"stage": 10}
@@ -0,0 +1,165 @@
+"""Statements sent per write endpoint: a regression here is an extra round trip"""
+
+from contextlib import contextmanager
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from config import settings
+from conftest import pointer
+from database import async_session, engine
+from models.drop_box import DropBox
+
+
+@contextmanager
+def statements():
+    """Collect the first keyword of every statement sent to the primary engine"""
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement.split()[0].upper())
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield sent
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+def created(client, path: str, body: dict) -> str:
+    response = client.post(path, json=body)
+    assert response.status_code == 200, response.text
+    return response.json()["objectId"]
+
+
+def new_drop_box(client, user: str) -> str:
+    async def create():
+        async with async_session() as db:
+            drop_box = DropBox(userId=user, type="Gold", value="10")
+            db.add(drop_box)
+            await db.commit()
+            return drop_box.objectId
+    return client.portal.call(create)
+
+
+def new_name() -> str:
+    return f"user-{uuid.uuid4().hex}"
+
+
+def signed_in(client, sign_up) -> tuple[str, dict]:
+    """A new user whose session token is already resolved (and cached)"""
+    user, headers = sign_up()
+    assert client.get("/parse/users/me", headers=headers).status_code == 200
+    return user, headers
+
+
+def summary_of(client, user: str) -> str:
+    response = client.get("/parse/classes/UserSummary", params={"where": f'{{"user": "{user}"}}'})
+    return response.json()["results"][0]["objectId"]
+
+
+def battle_log(client, sign_up) -> str:
+    return created(client, "/parse/classes/BattleLog", {"sender": pointer(sign_up()[0]), "receiver": pointer(sign_up()[0])})
+
+
+def friend_relation(client, sign_up) -> str:
+    return created(client, "/parse/classes/FriendRelation", {"users": [pointer(sign_up()[0]), pointer(sign_up()[0])]})
+
+
+def update_own_user(client, sign_up) -> tuple:
+    user, headers = signed_in(client, sign_up)
+    return "PUT", f"/parse/users/{user}", {"email": f"{new_name()}@example.com"}, headers
+
+
+# name: (setup, expected statements). A setup gets (client, sign_up) and
+# returns the request to count as (method, path, json body, headers)
+WRITES = {
+    # The user (INSERT ... ON CONFLICT RETURNING), its session and its UserSummary
+    "signup": (lambda client, sign_up: (
+        "POST", "/parse/users", {"username": new_name(), "password": "secret"}, {}
+    ), ["INSERT", "INSERT", "INSERT"]),
+    "signup via _User": (lambda client, sign_up: (
+        "POST", "/parse/classes/_User", {"username": new_name(), "password": "secret"}, {}
+    ), ["INSERT", "INSERT"]),
+    # The caller's User row, then the changed columns
+    "update own user": (update_own_user, ["SELECT", "UPDATE"]),
+    "update _User": (lambda client, sign_up: (
+        "PUT", f"/parse/classes/_User/{sign_up()[0]}", {"email": f"{new_name()}@example.com"}, {}
+    ), ["SELECT", "UPDATE"]),
+    # The unique googleUserId index rejects an ID linked elsewhere, no lookup
+    "link Google account": (lambda client, sign_up: (
+        "POST", "/parse/functions/linkGoogleID", {"authCode": new_name()}, signed_in(client, sign_up)[1]
+    ), ["SELECT", "UPDATE"]),
+    # Signup already made the summary: ON CONFLICT, then the existing one is read
+    "create UserSummary": (lambda client, sign_up: (
+        "POST", "/parse/classes/UserSummary", {"user": pointer(sign_up()[0])}, {}
+    ), ["INSERT", "SELECT"]),
+    "update UserSummary": (lambda client, sign_up: (
+        "PUT", f"/parse/classes/UserSummary/{summary_of(client, sign_up()[0])}", {"displayName": "moe"}, {}
+    ), ["UPDATE"]),
+    # Nothing the client may write: only an existence check
+    "update UserSummary with protected fields only": (lambda client, sign_up: (
+        "PUT", f"/parse/classes/UserSummary/{summary_of(client, sign_up()[0])}", {"ruby": 999}, {}
+    ), ["SELECT"]),
+    "create FriendRelation": (lambda client, sign_up: (
+        "POST", "/parse/classes/FriendRelation", {"users": [pointer(sign_up()[0]), pointer(sign_up()[0])]}, {}
+    ), ["INSERT"]),
+    "delete FriendRelation": (lambda client, sign_up: (
+        "DELETE", f"/parse/classes/FriendRelation/{friend_relation(client, sign_up)}", None, {}
+    ), ["DELETE"]),
+    # The target user's existence (404), then INSERT ... ON CONFLICT DO NOTHING
+    "addFriend": (lambda client, sign_up: (
+        "POST", "/parse/functions/addFriend", {"targetUserID": sign_up()[0]}, signed_in(client, sign_up)[1]
+    ), ["SELECT", "INSERT"]),
+    "create BattleLog": (lambda client, sign_up: (
+        "POST", "/parse/classes/BattleLog", {"sender": pointer(sign_up()[0]), "receiver": pointer(sign_up()[0])}, {}
+    ), ["INSERT"]),
+    "update BattleLog": (lambda client, sign_up: (
+        "PUT", f"/parse/classes/BattleLog/{battle_log(client, sign_up)}", {"senderClaim": True}, {}
+    ), ["UPDATE"]),
+    "update BattleLog with nothing": (lambda client, sign_up: (
+        "PUT", f"/parse/classes/BattleLog/{battle_log(client, sign_up)}", {}, {}
+    ), ["SELECT"]),
+    "delete BattleLog": (lambda client, sign_up: (
+        "DELETE", f"/parse/classes/BattleLog/{battle_log(client, sign_up)}", None, {}
+    ), ["DELETE"]),
+    "delete DropBox": (lambda client, sign_up: (
+        "DELETE", f"/parse/classes/DropBox/{new_drop_box(client, sign_up()[0])}", None, {}
+    ), ["DELETE"]),
+}
+
+
+@pytest.mark.parametrize("name", list(WRITES))
+def test_write_statements(client, sign_up, name):
+    setup, expected = WRITES[name]
+    method, path, body, headers = setup(client, sign_up)
+
+    with statements() as sent:
+        response = client.request(method, path, json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    assert sent == expected
+
+
+@pytest.mark.parametrize("history, history_insert", [(False, []), (True, ["INSERT"])])
+def test_game_data_save(client, make_user, monkeypatch, history, history_insert):
+    monkeypatch.setattr(settings, "GAME_DATA_HISTORY_ENABLED", history)
+    user = make_user()
+
+    # The save row, and its first history row when history is on
+    with statements() as sent:
+        response = client.post("/parse/classes/GameData", json={"user": pointer(user), "data": '{"stage": 1}'})
+    assert response.status_code == 200
+    assert sent == ["INSERT"] + history_insert
+    object_id = response.json()["objectId"]
+
+    with statements() as sent:
+        response = client.put(f"/parse/classes/GameData/{object_id}", json={"data": '{"stage": 2}'})
+    assert response.status_code == 200
+    assert sent == ["UPDATE"] + history_insert
+
+    # Unchanged: the conditional UPDATE matches nothing, then updatedAt is read back
+    with statements() as sent:
+        response = client.put(f"/parse/classes/GameData/{object_id}", json={"data": '{"stage": 2}'})
+    assert response.status_code == 200
+    assert sent == ["UPDATE", "SELECT"]
@@ -0,0 +1,54 @@
+import pytest
+
+from conftest import pointer
+
+
+def create(client, class_name: str, user: str, other: str) -> dict:
+    body = {
+        "UserSummary": {"user": pointer(user)},
+        "GameData": {"user": pointer(user), "data": "{}"},
+        "BattleLog": {"sender": pointer(user), "receiver": pointer(other)},
+    }[class_name]
+    response = client.post(f"/parse/classes/{class_name}", json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def stored(client, class_name: str, object_id: str) -> dict:
+    response = client.get(f"/parse/classes/{class_name}", params={"where": f'{{"objectId": "{object_id}"}}'})
+    return response.json()["results"][0]
+
+
+# Bodies with nothing the endpoint may write: only server-owned or no fields
+@pytest.mark.parametrize("class_name, body", [
+    ("UserSummary", {"ruby": 999, "gem": 999}),
+    ("GameData", {}),
+    ("BattleLog", {}),
+])
+def test_empty_update_leaves_the_object_alone(client, make_user, class_name, body):
+    object_id = create(client, class_name, make_user(), make_user())["objectId"]
+    before = stored(client, class_name, object_id)
+
+    response = client.put(f"/parse/classes/{class_name}/{object_id}", json=body)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["updatedAt"] == before["updatedAt"]
+    assert stored(client, class_name, object_id) == before
+
+
+@pytest.mark.parametrize("class_name, body", [
+    ("UserSummary", {}),
+    ("GameData", {}),
+    ("BattleLog", {}),
+])
+def test_empty_update_of_missing_object(client, class_name, body):
+    response = client.put(f"/parse/classes/{class_name}/ghost", json=body)
+    assert response.status_code == 404
+    assert response.json()["detail"]["code"] == 101
+
+
+@pytest.mark.parametrize("class_name", ["FriendRelation", "BattleLog", "DropBox"])
+def test_delete_missing_object(client, class_name):
+    response = client.delete(f"/parse/classes/{class_name}/ghost")
+    assert response.status_code == 404
+    assert response.json()["detail"]["code"] == 101
@@ -0,0 +1,16 @@
+import uuid
+
+
+def test_link_google_account_linked_to_another_user(client, sign_up):
+    google_id = f"google-{uuid.uuid4().hex}"
+    first, second = sign_up()[1], sign_up()[1]
+
+    response = client.post("/parse/functions/linkGoogleID", json={"authCode": google_id}, headers=first)
+    assert response.status_code == 200, response.text
+    # Linking the same ID again is fine for its owner, not for anyone else
+    response = client.post("/parse/functions/linkGoogleID", json={"authCode": google_id}, headers=first)
+    assert response.status_code == 200, response.text
+
+    response = client.post("/parse/functions/linkGoogleID", json={"authCode": google_id}, headers=second)
+    assert response.status_code == 400
+    assert response.json()["detail"] == {"code": 202, "error": "Google account already linked to another user"}
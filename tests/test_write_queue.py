@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select, text
+
+from config import settings
+from models.battle_log import BattleLog
+from models.game_data import GameData
+from routers.classes import _update_game_data
+from services.game_data_buffer import save_stats
+from services.write_queue import write_queue
+
+
+def create_log(sender_id: str, receiver_id: str, defer_foreign_keys: bool = False):
+    async def operation(session):
+        if defer_foreign_keys:
+            # Moves the foreign key check from the INSERT to the COMMIT
+            await session.execute(text("PRAGMA defer_foreign_keys = ON"))
+        battle_log = BattleLog(senderId=sender_id, receiverId=receiver_id)
+        session.add(battle_log)
+        await session.flush()
+        return battle_log.objectId
+    return operation
+
+
+def create_log_ignoring_errors(sender_id: str, receiver_id: str):
+    """Like the /batch operation before items had savepoints: the flush error is swallowed"""
+    async def operation(session):
+        try:
+            await create_log(sender_id, receiver_id)(session)
+        except Exception:
+            pass
+    return operation
+
+
+async def stored_logs(sender_id: str) -> list:
+    async def operation(session):
+        result = await session.execute(select(BattleLog.objectId).where(BattleLog.senderId == sender_id))
+        return sorted(result.scalars())
+    return await write_queue.submit(operation)
+
+
+@pytest.fixture
+async def queue(client):
+    write_queue.start()
+    yield write_queue
+    await write_queue.stop()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("failing", [create_log, create_log_ignoring_errors])
+async def test_failed_operation_does_not_fail_its_group(queue, make_user, failing):
+    sender, receiver = make_user(), make_user()
+    results = await asyncio.gather(
+        queue.submit(failing(sender, "ghost")),
+        *[queue.submit(create_log(sender, receiver)) for _ in range(5)],
+        return_exceptions=True
+    )
+
+    assert all(isinstance(object_id, str) for object_id in results[1:])
+    assert await stored_logs(sender) == sorted(results[1:])
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(not settings.DATABASE_URL.startswith("sqlite"), reason="defers foreign keys with a SQLite pragma")
+async def test_failed_commit_reruns_operations_one_by_one(queue, make_user):
+    sender, receiver = make_user(), make_user()
+    retried = queue.retried_groups
+    results = await asyncio.gather(
+        queue.submit(create_log(sender, receiver)),
+        queue.submit(create_log(sender, "ghost", defer_foreign_keys=True)),
+        queue.submit(create_log(sender, receiver)),
+        return_exceptions=True
+    )
+
+    assert isinstance(results[1], Exception)
+    assert await stored_logs(sender) == sorted([results[0], results[2]])
+    assert queue.retried_groups == retried + 1
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(not settings.DATABASE_URL.startswith("sqlite"), reason="defers foreign keys with a SQLite pragma")
+async def test_side_effects_run_once_after_a_retried_commit(queue, make_user):
+    sender = make_user()
+
+    async def create_save(session):
+        game_data = GameData(userId=sender, data='{"gold": 1}')
+        session.add(game_data)
+        await session.flush()
+        return game_data.objectId
+
+    object_id = await queue.submit(create_save)
+    saves, unchanged = save_stats.saves, save_stats.unchanged
+
+    results = await asyncio.gather(
+        queue.submit(_update_game_data(object_id, {"data": '{"gold": 2}'})),
+        queue.submit(create_log(sender, "ghost", defer_foreign_keys=True)),
+        queue.submit(_update_game_data(object_id, {"data": '{"gold": 2}'})),
+        return_exceptions=True
+    )
+
+    assert isinstance(results[1], Exception)
+    # One changed save and one unchanged one, however often they were run
+    assert save_stats.saves == saves + 2
+    assert save_stats.unchanged == unchanged + 1